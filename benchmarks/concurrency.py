@@ -0,0 +1,250 @@
+"""Check dashboard.main under parallel invocations on one instance, offline.
+
+Every round sends reads and writes at once while another instance pushes a
+meeting to gh-pages, so requests run while the local database is replaced.
+Once done, the database on gh-pages must hold exactly what the writes and
+the other instance asked for. Run it from the repository root:
+
+    python -m benchmarks.concurrency --parallel 16 --rounds 10
+
+It exits with a non-zero status when anything is off.
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from json import loads
+from tempfile import TemporaryDirectory
+
+from .run import (
+    API_AUDIENCE,
+    AUTH0_DOMAIN,
+    PERMISSION,
+    build_request,
+    configure_environment,
+    reset_instance,
+)
+
+SEEDED_MEETINGS = 200
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--parallel", type=int, default=16, help="requests at once")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument(
+        "--push-window",
+        type=float,
+        default=0.05,
+        help="seconds writes wait for others to share their push",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with TemporaryDirectory() as workdir:
+        os.environ["PUSH_COALESCE_WINDOW"] = str(args.push_window)
+        configure_environment(argparse.Namespace(publish_mode="file"), workdir)
+
+        from .fake_auth import FakeAuth0
+
+        auth0 = FakeAuth0(AUTH0_DOMAIN, API_AUDIENCE).start()
+        os.environ["JWKS_URL"] = auth0.jwks_url
+        try:
+            problems = run_check(args, workdir, auth0)
+        finally:
+            auth0.stop()
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} problems")
+    return 1 if problems else 0
+
+
+def run_check(args, workdir, auth0):
+    from functions import github
+    from functions.dashboard import main as dashboard
+    from .fake_github import FakeGitHub
+    from .seed import seed_database
+
+    seed_path = os.path.join(workdir, "seed.db")
+    seed_database(seed_path, SEEDED_MEETINGS)
+    fake_github = FakeGitHub().start()
+    with open(seed_path, "rb") as seed_file:
+        fake_github.publish({github.DB_FILE_PATH: seed_file.read()})
+    reset_instance(fake_github.base_url)
+
+    token = auth0.sign_token([PERMISSION])
+    loop = asyncio.new_event_loop()
+    loop.set_default_executor(ThreadPoolExecutor(args.parallel))
+    expected = {"created": set(), "ended": set(), "deleted": set(), "external": set()}
+    problems = []
+    try:
+        for round_index in range(args.rounds):
+            requests = build_round(round_index, args.parallel, expected)
+            responses = loop.run_until_complete(
+                send_all(
+                    dashboard,
+                    token,
+                    requests,
+                    publish_external_meeting(
+                        fake_github, github.DB_FILE_PATH, round_index, expected
+                    ),
+                )
+            )
+            for (request, expected_status), response in zip(requests, responses):
+                problems.extend(check_response(request, expected_status, response))
+        remote_path = os.path.join(workdir, "remote.db")
+        with open(remote_path, "wb") as remote_file:
+            remote_file.write(fake_github.read_file(github.DB_FILE_PATH))
+        problems.extend(check_database(remote_path, expected))
+    finally:
+        loop.close()
+        fake_github.stop()
+    return problems
+
+
+def build_round(round_index, parallel, expected):
+    """Return the requests of a round with their expected status.
+
+    Ended and deleted meetings are seeded ones no other request touches.
+    """
+    requests = []
+    for index in range(parallel):
+        number = round_index * parallel + index
+        kind = index % 5
+        if kind == 0:
+            name = f"Concurrent {number}"
+            expected["created"].add(name)
+            body = {
+                "roomName": name,
+                "participants": [f"Participant {number % 40 + 1}", f"Guest {number}"],
+                "labels": [f"Label {number % 20 + 1}"],
+            }
+            requests.append((("POST", "meetings", None, body, {}), 201))
+        elif kind == 1:
+            requests.append((("GET", "meetings", None, None, {}), 200))
+        elif kind == 2:
+            params = {"status": "ended", "limit": "20"}
+            requests.append((("GET", "meetings", None, None, params), 200))
+        elif kind == 3:
+            # The seed's last 20 meetings are the active ones.
+            meeting_id = SEEDED_MEETINGS - number % 20
+            if meeting_id in expected["ended"]:
+                continue
+            expected["ended"].add(meeting_id)
+            body = {"endingFlag": True, "labels": ["Label 1"]}
+            requests.append((("PATCH", "meetings", meeting_id, body, {}), 201))
+        else:
+            meeting_id = number + 1
+            expected["deleted"].add(meeting_id)
+            requests.append((("DELETE", "meetings", meeting_id, None, {}), 200))
+    return requests
+
+
+async def send_all(dashboard, token, requests, external_push):
+    responses = [
+        dashboard.main(build_request(token, *request)) for request, _ in requests
+    ]
+    *responses, _ = await asyncio.gather(
+        *responses, asyncio.to_thread(external_push), return_exceptions=True
+    )
+    return responses
+
+
+def publish_external_meeting(fake_github, db_path, round_index, expected):
+    """Return a callable adding a meeting to gh-pages like another instance."""
+    name = f"External {round_index}"
+    expected["external"].add(name)
+
+    def push():
+        with TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "database.db")
+            with open(path, "wb") as db_file:
+                db_file.write(fake_github.read_file(db_path))
+            connection = sqlite3.connect(path)
+            with connection:
+                connection.execute(
+                    "INSERT INTO meeting (name, date_started, link)"
+                    " VALUES (?, '2021-01-01 00:00:00.000000', '')",
+                    (name,),
+                )
+                connection.execute(
+                    "INSERT INTO daily_stats VALUES ('2021-01-01', 1)"
+                    " ON CONFLICT (day) DO UPDATE SET meeting_count = meeting_count + 1"
+                )
+            connection.close()
+            with open(path, "rb") as db_file:
+                fake_github.publish({db_path: db_file.read()})
+
+    return push
+
+
+def check_response(request, expected_status, response):
+    method, resource, resource_id, _, params = request
+    label = f"{method} {resource} {resource_id or ''} {params or ''}".strip()
+    if isinstance(response, Exception):
+        return [f"{label}: {response!r}"]
+    if response.status_code != expected_status:
+        return [f"{label}: {response.status_code} {response.get_body()[:200]!r}"]
+    body = response.get_body().decode()
+    try:
+        if method == "GET" and params:
+            [loads(line) for line in body.splitlines()]
+        else:
+            loads(body)
+    except ValueError:
+        return [f"{label}: unreadable body {body[:200]!r}"]
+    return []
+
+
+def check_database(path, expected):
+    from functions.models import REBUILD_STATS_STATEMENTS
+
+    problems = []
+    connection = sqlite3.connect(path)
+    if connection.execute("PRAGMA integrity_check").fetchone()[0] != "ok":
+        problems.append("the database is corrupt")
+
+    names = [row[0] for row in connection.execute("SELECT name FROM meeting")]
+    for name in expected["created"] | expected["external"]:
+        if names.count(name) != 1:
+            problems.append(f"{name} is there {names.count(name)} times")
+    for meeting_id in expected["deleted"]:
+        if connection.execute(
+            "SELECT 1 FROM meeting WHERE id = ?", (meeting_id,)
+        ).fetchone():
+            problems.append(f"meeting {meeting_id} wasn't deleted")
+    for meeting_id in expected["ended"]:
+        row = connection.execute(
+            "SELECT date_ended FROM meeting WHERE id = ?", (meeting_id,)
+        ).fetchone()
+        if row is None or row[0] is None:
+            problems.append(f"meeting {meeting_id} didn't end")
+    missing_participants = connection.execute(
+        "SELECT meeting.name FROM meeting WHERE name LIKE 'Concurrent %' AND"
+        " (SELECT count(*) FROM meetings_participants"
+        "  WHERE meeting_id = meeting.id) != 2"
+    ).fetchall()
+    problems.extend(f"{name} lost participants" for name, in missing_participants)
+
+    # Incrementally maintained summary tables must match a full rebuild.
+    tables = ("label_stats", "participant_stats", "daily_stats")
+    maintained = {
+        table: sorted(connection.execute(f"SELECT * FROM {table}")) for table in tables
+    }
+    with connection:
+        for statement in REBUILD_STATS_STATEMENTS:
+            connection.execute(str(statement))
+    for table in tables:
+        if sorted(connection.execute(f"SELECT * FROM {table}")) != maintained[table]:
+            problems.append(f"{table} doesn't match its rebuild")
+    connection.close()
+    return problems
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,103 @@
+"""Local stand-in for Auth0: a JWKS endpoint and the key signing the tokens."""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from time import sleep, time
+from uuid import uuid4
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+KEY_ID = "benchmark-key"
+ALGORITHM = "RS256"
+
+
+class FakeAuth0:
+    def __init__(self, domain, audience):
+        self.domain = domain
+        self.audience = audience
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.private_key = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+        public_key = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        self.public_jwk = jwk.construct(public_key, ALGORITHM).to_dict()
+        self.key_ids = [KEY_ID]
+        self.jwks = self.build_jwks()
+        # Requests for the key set, and how the next ones are answered.
+        self.request_count = 0
+        self.latency = 0
+        self.failing = False
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class())
+        self.jwks_url = (
+            f"http://127.0.0.1:{self.server.server_port}/.well-known/jwks.json"
+        )
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def build_jwks(self):
+        keys = [
+            {**self.public_jwk, "kid": kid, "use": "sig", "alg": ALGORITHM}
+            for kid in self.key_ids
+        ]
+        return dumps({"keys": keys}).encode()
+
+    def add_key(self, kid):
+        """Publish the signing key under another ``kid`` too, like a rotation."""
+        self.key_ids.append(kid)
+        self.jwks = self.build_jwks()
+
+    def remove_key(self, kid):
+        """Stop publishing the signing key under ``kid``."""
+        self.key_ids.remove(kid)
+        self.jwks = self.build_jwks()
+
+    def sign_token(self, permissions, lifetime=3600):
+        """Return an access token like the ones Auth0 issues for the API."""
+        claims = {
+            "iss": f"https://{self.domain}/",
+            "aud": self.audience,
+            "sub": "benchmark|user",
+            "iat": int(time()),
+            "exp": int(time()) + lifetime,
+            # Tokens differ, so each one goes through signature verification.
+            "jti": uuid4().hex,
+            "permissions": permissions,
+        }
+        return jwt.encode(
+            claims, self.private_key, algorithm=ALGORITHM, headers={"kid": KEY_ID}
+        )
+
+    def handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.request_count += 1
+                sleep(fake.latency)
+                if fake.failing:
+                    self.send_error(503)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(fake.jwks)))
+                self.end_headers()
+                self.wfile.write(fake.jwks)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,340 @@
+"""Local stand-in for the parts of the GitHub REST API the backend calls.
+
+It keeps an in-memory git object store holding one repository with a
+gh-pages branch, and answers the contents API (``update_file``) and the Git
+Data API (refs, trees, blobs and commits) like api.github.com does, including
+conditional requests on the branch ref, 409s and 422s on stale pushes, raw
+blobs and gzipped responses. Responses report a rate limit that every
+request but a 304 draws from, without ever enforcing it.
+"""
+
+import gzip
+import re
+import threading
+from base64 import b64decode, b64encode
+from hashlib import sha1
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps, loads
+from time import sleep, time
+
+from functions.github import REPO_FULL_NAME, TARGET_BRANCH
+from functions.github.chunks import git_blob_sha
+from functions.github.transfer import RAW_MEDIA_TYPE
+
+BRANCH_REF = f"heads/{TARGET_BRANCH}"
+
+
+class FakeGitHub:
+    def __init__(self, latency=0.0, rate_limit=5000):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_limit_remaining = rate_limit
+        self.rate_limit_reset = int(time()) + 3600
+        self.lock = threading.Lock()
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {}
+        self.branch_sha = None
+        self.request_count = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class())
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.repo_url = f"{self.base_url}/repos/{REPO_FULL_NAME}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def publish(self, files):
+        """Commit ``files``, a dict of path to bytes, on top of gh-pages."""
+        with self.lock:
+            base_tree = (
+                self.commits[self.branch_sha]["tree"] if self.branch_sha else None
+            )
+            tree_sha = self.build_tree(
+                base_tree,
+                [
+                    {"path": path, "mode": "100644", "sha": self.add_blob(content)}
+                    for path, content in files.items()
+                ],
+            )
+            self.branch_sha = self.add_commit("Seed database", tree_sha, self.parents())
+
+    def read_file(self, path):
+        """Return the content of ``path`` on gh-pages, None if it doesn't exist."""
+        with self.lock:
+            tree_sha = self.commits[self.branch_sha]["tree"]
+            *directories, name = path.split("/")
+            for directory in directories:
+                tree_sha = self.trees[tree_sha][directory]["sha"]
+            entry = self.trees[tree_sha].get(name)
+            return self.blobs[entry["sha"]] if entry else None
+
+    # Object store.
+
+    def add_blob(self, content):
+        sha = git_blob_sha(content)
+        self.blobs[sha] = content
+        return sha
+
+    def add_tree(self, entries):
+        sha = sha1(dumps(entries, sort_keys=True).encode()).hexdigest()
+        self.trees[sha] = entries
+        return sha
+
+    def add_commit(self, message, tree_sha, parents):
+        commit = {"message": message, "tree": tree_sha, "parents": parents}
+        sha = sha1(dumps(commit, sort_keys=True).encode()).hexdigest()
+        self.commits[sha] = commit
+        return sha
+
+    def parents(self):
+        return [self.branch_sha] if self.branch_sha else []
+
+    def build_tree(self, base_tree_sha, elements):
+        """Apply tree ``elements`` with nested paths on top of a base tree."""
+        entries = dict(self.trees[base_tree_sha]) if base_tree_sha else {}
+        nested = {}
+        for element in elements:
+            directory, _, rest = element["path"].partition("/")
+            if rest:
+                nested.setdefault(directory, []).append({**element, "path": rest})
+            elif element.get("sha", "") is None:
+                entries.pop(directory, None)
+            else:
+                sha = element.get("sha") or self.add_blob(element["content"].encode())
+                entries[directory] = {
+                    "mode": element["mode"],
+                    "type": "blob",
+                    "sha": sha,
+                    "size": len(self.blobs[sha]),
+                }
+        for directory, directory_elements in nested.items():
+            base = entries.get(directory, {}).get("sha")
+            entries[directory] = {
+                "mode": "040000",
+                "type": "tree",
+                "sha": self.build_tree(base, directory_elements),
+            }
+        return self.add_tree(entries)
+
+    def resolve_tree(self, sha):
+        return self.commits[sha]["tree"] if sha in self.commits else sha
+
+    # JSON representations.
+
+    def ref_json(self):
+        return {
+            "ref": f"refs/{BRANCH_REF}",
+            "url": f"{self.repo_url}/git/refs/{BRANCH_REF}",
+            "object": {
+                "sha": self.branch_sha,
+                "type": "commit",
+                "url": f"{self.repo_url}/git/commits/{self.branch_sha}",
+            },
+        }
+
+    def tree_json(self, sha):
+        tree = []
+        for path, entry in sorted(self.trees[sha].items()):
+            tree.append({"path": path, "url": self.object_url(entry), **entry})
+        return {"sha": sha, "url": f"{self.repo_url}/git/trees/{sha}", "tree": tree}
+
+    def commit_json(self, sha):
+        commit = self.commits[sha]
+        return {
+            "sha": sha,
+            "url": f"{self.repo_url}/git/commits/{sha}",
+            "message": commit["message"],
+            "tree": {
+                "sha": commit["tree"],
+                "url": f"{self.repo_url}/git/trees/{commit['tree']}",
+            },
+            "parents": [
+                {"sha": parent, "url": f"{self.repo_url}/git/commits/{parent}"}
+                for parent in commit["parents"]
+            ],
+        }
+
+    def object_url(self, entry):
+        kind = "trees" if entry["type"] == "tree" else "blobs"
+        return f"{self.repo_url}/git/{kind}/{entry['sha']}"
+
+    # Routes, each returns a status code and a JSON body.
+
+    def get_repo(self, body):
+        owner, name = REPO_FULL_NAME.split("/")
+        return 200, {
+            "name": name,
+            "full_name": REPO_FULL_NAME,
+            "owner": {"login": owner},
+            "url": self.repo_url,
+            "default_branch": "main",
+        }
+
+    def get_ref(self, body):
+        return 200, self.ref_json()
+
+    def edit_ref(self, body):
+        if not body.get("force") and self.branch_sha not in self.ancestors(body["sha"]):
+            return 422, {"message": "Update is not a fast forward"}
+        self.branch_sha = body["sha"]
+        return 200, self.ref_json()
+
+    def ancestors(self, sha):
+        ancestors, pending = set(), [sha]
+        while pending:
+            commit_sha = pending.pop()
+            if commit_sha not in ancestors:
+                ancestors.add(commit_sha)
+                pending.extend(self.commits[commit_sha]["parents"])
+        return ancestors
+
+    def get_tree(self, body, sha):
+        return 200, self.tree_json(self.resolve_tree(sha))
+
+    def create_tree(self, body):
+        sha = self.build_tree(body.get("base_tree"), body["tree"])
+        return 201, self.tree_json(sha)
+
+    def get_blob(self, body, sha):
+        content = self.blobs[sha]
+        return 200, {
+            "sha": sha,
+            "size": len(content),
+            "encoding": "base64",
+            "content": b64encode(content).decode(),
+            "url": f"{self.repo_url}/git/blobs/{sha}",
+        }
+
+    def get_raw_blob(self, body, sha):
+        return 200, self.blobs[sha]
+
+    def create_blob(self, body):
+        content = body["content"].encode()
+        if body.get("encoding") == "base64":
+            content = b64decode(content)
+        sha = self.add_blob(content)
+        return 201, {"sha": sha, "url": f"{self.repo_url}/git/blobs/{sha}"}
+
+    def get_commit(self, body, sha):
+        return 200, self.commit_json(sha)
+
+    def create_commit(self, body):
+        sha = self.add_commit(body["message"], body["tree"], body["parents"])
+        return 201, self.commit_json(sha)
+
+    def update_file(self, body, path):
+        tree_sha = self.commits[self.branch_sha]["tree"]
+        current = self.trees[tree_sha].get(path)
+        if current is None or current["sha"] != body.get("sha"):
+            return 409, {"message": f"{path} does not match {body.get('sha')}"}
+        tree_sha = self.build_tree(
+            tree_sha,
+            [
+                {
+                    "path": path,
+                    "mode": "100644",
+                    "sha": self.add_blob(b64decode(body["content"])),
+                }
+            ],
+        )
+        self.branch_sha = self.add_commit(body["message"], tree_sha, self.parents())
+        entry = self.trees[tree_sha][path]
+        return 200, {
+            "content": {
+                "name": path,
+                "path": path,
+                "sha": entry["sha"],
+                "size": entry["size"],
+                "type": "file",
+                "url": f"{self.repo_url}/contents/{path}",
+            },
+            "commit": self.commit_json(self.branch_sha),
+        }
+
+    def routes(self):
+        """Return (method, path pattern, media type or None, route) tuples."""
+        repo = re.escape(f"/repos/{REPO_FULL_NAME}")
+        ref = f"{repo}/git/refs?/{re.escape(BRANCH_REF)}"
+        return [
+            ("GET", f"{repo}", None, self.get_repo),
+            ("GET", ref, None, self.get_ref),
+            ("PATCH", ref, None, self.edit_ref),
+            ("GET", f"{repo}/git/trees/(\\w+)", None, self.get_tree),
+            ("POST", f"{repo}/git/trees", None, self.create_tree),
+            ("GET", f"{repo}/git/blobs/(\\w+)", RAW_MEDIA_TYPE, self.get_raw_blob),
+            ("GET", f"{repo}/git/blobs/(\\w+)", None, self.get_blob),
+            ("POST", f"{repo}/git/blobs", None, self.create_blob),
+            ("GET", f"{repo}/git/commits/(\\w+)", None, self.get_commit),
+            ("POST", f"{repo}/git/commits", None, self.create_commit),
+            ("PUT", f"{repo}/contents/(.+)", None, self.update_file),
+        ]
+
+    def handle(self, method, path, body, accept=""):
+        """Return the status code and either a JSON body or raw bytes."""
+        for route_method, pattern, media_type, route in self.routes():
+            match = re.fullmatch(pattern, path)
+            if (
+                route_method == method
+                and match
+                and (media_type is None or media_type in accept)
+            ):
+                with self.lock:
+                    self.request_count += 1
+                    return route(body, *match.groups())
+        return 404, {"message": "Not Found"}
+
+    def handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Keep-alive connections would wait on delayed ACKs otherwise.
+            disable_nagle_algorithm = True
+
+            def handle_request(self):
+                sleep(fake.latency)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = loads(self.rfile.read(length)) if length else {}
+                status, response = fake.handle(
+                    self.command,
+                    self.path.split("?")[0],
+                    body,
+                    self.headers.get("Accept", ""),
+                )
+                if isinstance(response, bytes):
+                    payload, content_type = response, "application/octet-stream"
+                else:
+                    payload, content_type = dumps(response).encode(), "application/json"
+                etag = f'"{sha1(payload).hexdigest()}"'
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    status, payload = 304, b""
+                with fake.lock:
+                    if status != 304:
+                        fake.rate_limit_remaining = max(
+                            0, fake.rate_limit_remaining - 1
+                        )
+                    rate_limit_remaining = fake.rate_limit_remaining
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("X-RateLimit-Limit", str(fake.rate_limit))
+                self.send_header("X-RateLimit-Remaining", str(rate_limit_remaining))
+                self.send_header("X-RateLimit-Reset", str(fake.rate_limit_reset))
+                if payload and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    payload = gzip.compress(payload, compresslevel=1)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PATCH = do_PUT = handle_request
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,170 @@
+"""Check the Auth0 signing key cache against a local JWKS endpoint, offline.
+
+A cold instance verifying tokens from many threads at once fetches the key
+set once and verifies every token. The cache then serves hits without a
+fetch, refreshes for an unknown ``kid`` at most once per cooldown, serves
+stale keys while refreshing in the background and keeps its keys when a
+refresh fails. Cached tokens age the key set too, so a key rotated out
+revokes them once the background refresh has run, and they are verified
+again once the key set is too stale to trust. Run it from the repository
+root:
+
+    python -m benchmarks.jwks
+
+It exits with a non-zero status when anything is off.
+"""
+
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+from time import monotonic, sleep, time
+
+from .run import API_AUDIENCE, AUTH0_DOMAIN, PERMISSION, configure_environment
+
+ROTATED_KEY_ID = "rotated-key"
+# Short enough for the check to take a few seconds.
+REFRESH_COOLDOWN = 0.5
+TTL = 1.5
+STALE_TTL = 3
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--parallel", type=int, default=16, help="cold requests")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with TemporaryDirectory() as workdir:
+        configure_environment(argparse.Namespace(publish_mode="file"), workdir)
+
+        from .fake_auth import FakeAuth0
+
+        auth0 = FakeAuth0(AUTH0_DOMAIN, API_AUDIENCE).start()
+        os.environ["JWKS_URL"] = auth0.jwks_url
+        try:
+            problems = check_cold_instance(auth0, args.parallel)
+            problems.extend(check_cache(auth0))
+            problems.extend(check_token_cache(auth0))
+        finally:
+            auth0.stop()
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} problems")
+    return 1 if problems else 0
+
+
+def check_cold_instance(auth0, parallel):
+    from functions.auth import verify_decode_jwt
+
+    tokens = [auth0.sign_token([PERMISSION]) for _ in range(parallel)]
+    with ThreadPoolExecutor(parallel) as executor:
+        results = list(executor.map(verify_decode_jwt, tokens))
+    problems = [
+        f"cold request {index}: {error.message}"
+        for index, (_, error) in enumerate(results)
+        if error is not None
+    ]
+    if auth0.request_count != 1:
+        problems.append(
+            f"cold requests fetched the key set {auth0.request_count} times"
+        )
+    return problems
+
+
+def check_cache(auth0):
+    from functions.auth import JWKSCache
+    from .fake_auth import KEY_ID
+
+    cache = JWKSCache(auth0.jwks_url, TTL, STALE_TTL, REFRESH_COOLDOWN, 5)
+    problems = []
+
+    def expect(name, kid, found, fetches):
+        request_count = auth0.request_count
+        key = cache.get_key(kid)
+        if cache._background_refresh is not None:
+            cache._background_refresh.join()
+        fetched = auth0.request_count - request_count
+        if (key is not None) != found:
+            problems.append(f"{name}: the key was {'not ' if found else ''}found")
+        if fetched != fetches:
+            problems.append(f"{name}: {fetched} fetches, expected {fetches}")
+        return key
+
+    expect("first key", KEY_ID, True, 1)
+    expect("cache hit", KEY_ID, True, 0)
+    auth0.add_key(ROTATED_KEY_ID)
+    expect("unknown kid within the cooldown", ROTATED_KEY_ID, False, 0)
+    sleep(REFRESH_COOLDOWN)
+    expect("unknown kid after the cooldown", ROTATED_KEY_ID, True, 1)
+
+    sleep(TTL)
+    auth0.latency = 1
+    request_count = auth0.request_count
+    started_at = monotonic()
+    key = cache.get_key(KEY_ID)
+    if key is None or monotonic() - started_at >= auth0.latency:
+        problems.append("stale key: not served while refreshing in the background")
+    cache._background_refresh.join()
+    if auth0.request_count - request_count != 1:
+        problems.append("stale key: not refreshed in the background")
+    auth0.latency = 0
+
+    sleep(STALE_TTL)
+    auth0.failing = True
+    # The failed refresh is logged with its traceback, which is expected here.
+    logging.disable(logging.ERROR)
+    try:
+        expect("failed refresh", KEY_ID, True, 1)
+        expect("unknown kid after a failed refresh", "unknown-key", False, 0)
+    finally:
+        logging.disable(logging.NOTSET)
+        auth0.failing = False
+    return problems
+
+
+def check_token_cache(auth0):
+    from functions.auth import JWKSCache, TokenCache
+    from .fake_auth import KEY_ID
+
+    cache = JWKSCache(auth0.jwks_url, TTL, STALE_TTL, REFRESH_COOLDOWN, 5)
+    tokens = TokenCache(8)
+    problems = []
+    token = auth0.sign_token([PERMISSION])
+    payload = {"exp": time() + 3600}
+
+    cache.get_key(KEY_ID)
+    tokens.put(token, KEY_ID, payload)
+    if tokens.get(token, cache) is None:
+        problems.append("cached token: not served")
+
+    sleep(TTL)
+    auth0.remove_key(KEY_ID)
+    request_count = auth0.request_count
+    tokens.get(token, cache)
+    if cache._background_refresh is not None:
+        cache._background_refresh.join()
+    if auth0.request_count - request_count != 1:
+        problems.append("cached token past the TTL: key set not refreshed")
+    if tokens.get(token, cache) is not None:
+        problems.append("cached token: served after its key was rotated out")
+    auth0.add_key(KEY_ID)
+
+    cache = JWKSCache(auth0.jwks_url, TTL, STALE_TTL, REFRESH_COOLDOWN, 5)
+    cache.get_key(KEY_ID)
+    tokens.put(token, KEY_ID, payload)
+    sleep(STALE_TTL)
+    request_count = auth0.request_count
+    if tokens.get(token, cache) is not None:
+        problems.append("cached token: served with a key set past the stale TTL")
+    if auth0.request_count != request_count:
+        problems.append("cached token past the stale TTL: waited for a fetch")
+    return problems
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
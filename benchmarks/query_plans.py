@@ -0,0 +1,170 @@
+"""Check the dashboard's queries use the indexes meant for them, offline.
+
+Each request below is sent to dashboard.main, the SELECT statements it runs
+are captured and explained with EXPLAIN QUERY PLAN, and the indexes named in
+their plans must include the ones expected for the request. Run it from the
+repository root:
+
+    python -m benchmarks.query_plans
+
+It exits with a non-zero status when an index isn't used.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from tempfile import TemporaryDirectory
+
+from .run import (
+    API_AUDIENCE,
+    AUTH0_DOMAIN,
+    PERMISSION,
+    build_request,
+    configure_environment,
+    reset_instance,
+)
+
+SEEDED_MEETINGS = 1000
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--meetings", type=int, default=SEEDED_MEETINGS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with TemporaryDirectory() as workdir:
+        configure_environment(argparse.Namespace(publish_mode="file"), workdir)
+
+        from .fake_auth import FakeAuth0
+
+        auth0 = FakeAuth0(AUTH0_DOMAIN, API_AUDIENCE).start()
+        os.environ["JWKS_URL"] = auth0.jwks_url
+        try:
+            problems = run_check(args, workdir, auth0)
+        finally:
+            auth0.stop()
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} problems")
+    return 1 if problems else 0
+
+
+def run_check(args, workdir, auth0):
+    from sqlalchemy import event
+
+    from functions import github, models
+    from functions.dashboard import main as dashboard
+    from .fake_github import FakeGitHub
+    from .seed import seed_database
+
+    seed_path = os.path.join(workdir, "seed.db")
+    seed_database(seed_path, args.meetings)
+    fake_github = FakeGitHub().start()
+    with open(seed_path, "rb") as seed_file:
+        fake_github.publish({github.DB_FILE_PATH: seed_file.read()})
+    reset_instance(fake_github.base_url)
+
+    statements = []
+
+    def record_statement(connection, cursor, statement, parameters, context, many):
+        if not many and statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(models.engine, "before_cursor_execute", record_statement)
+    token = auth0.sign_token([PERMISSION])
+    loop = asyncio.new_event_loop()
+    problems = []
+    try:
+        for name, request, expected_indexes in plan_requests():
+            statements.clear()
+            response = loop.run_until_complete(
+                dashboard.main(build_request(token, *request))
+            )
+            if response.status_code >= 400:
+                problems.append(f"{name}: got {response.status_code}")
+                continue
+            indexes = set()
+            for statement, parameters in list(statements):
+                indexes.update(plan_indexes(models.engine, statement, parameters))
+            print(f"{name:<36}{', '.join(sorted(indexes))}", flush=True)
+            problems.extend(
+                f"{name}: {index} isn't used"
+                for index in sorted(expected_indexes - indexes)
+            )
+    finally:
+        event.remove(models.engine, "before_cursor_execute", record_statement)
+        loop.close()
+        fake_github.stop()
+    return problems
+
+
+def plan_indexes(engine, statement, parameters):
+    """Return the indexes the plan of ``statement`` searches or scans."""
+    with engine.connect() as connection:
+        plan = connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        ).all()
+    indexes = set()
+    for *_, detail in plan:
+        words = detail.split()
+        if "INDEX" in words and words.index("INDEX") + 1 < len(words):
+            indexes.add(words[words.index("INDEX") + 1])
+    return indexes
+
+
+def plan_requests():
+    """Yield each request with the indexes its queries must use."""
+    history = {"limit": "50"}
+    yield (
+        "GET active meetings",
+        ("GET", "meetings", None, None, {}),
+        {"ix_meeting_active"},
+    )
+    yield (
+        "GET ended history page",
+        ("GET", "meetings", None, None, {"status": "ended", **history}),
+        {"ix_meeting_date_started"},
+    )
+    yield (
+        "GET participant history",
+        ("GET", "meetings", None, None, {"participant": "participant 1", **history}),
+        {"ix_participant_name_nocase", "ix_meetings_participants_participant_id"},
+    )
+    yield (
+        "GET label history",
+        ("GET", "meetings", None, None, {"label": "LABEL 1", **history}),
+        {"ix_label_name_nocase", "ix_meetings_labels_label_id"},
+    )
+    yield (
+        "POST meeting",
+        (
+            "POST",
+            "meetings",
+            None,
+            {
+                "roomName": "Query plans",
+                "participants": ["PARTICIPANT 1", "Participant 2"],
+                "labels": ["label 2"],
+            },
+            {},
+        ),
+        {"ix_participant_name_nocase", "ix_label_name_nocase"},
+    )
+    yield (
+        "PATCH participant",
+        ("PATCH", "participants", 1, {"name": "Participant one"}, {}),
+        {"ix_meetings_participants_participant_id"},
+    )
+    yield (
+        "DELETE label",
+        ("DELETE", "labels", 2, None, {}),
+        {"ix_meetings_labels_label_id"},
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,289 @@
+"""Benchmark dashboard.main end to end, offline.
+
+GitHub and Auth0 are replaced by local servers (see fake_github and
+fake_auth), so the numbers only depend on this backend and on the simulated
+GitHub latency. Run it from the repository root:
+
+    python -m benchmarks.run --meetings 1000 10000 100000 --requests 50
+
+Every database size starts from a cold instance state. For each endpoint the
+latency percentiles are reported along with the mean time spent in each
+phase, read from the Server-Timing header: auth, clone (syncing the local
+database with gh-pages), serialize, push, and query, which is whatever is
+left, and the mean number of SQL statements.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from collections import Counter
+from json import dumps
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from uuid import uuid4
+
+import azure.functions as func
+
+AUTH0_DOMAIN = "benchmark.auth0.local"
+API_AUDIENCE = "meetings-api"
+PERMISSION = "manage:meetings"
+PHASES = ("auth", "clone", "query", "serialize", "push")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--meetings", type=int, nargs="+", default=[1000], help="database sizes"
+    )
+    parser.add_argument("--requests", type=int, default=50, help="per endpoint")
+    parser.add_argument(
+        "--github-latency", type=float, default=0, help="milliseconds per request"
+    )
+    parser.add_argument("--publish-mode", choices=["file", "chunked"], default="file")
+    parser.add_argument(
+        "--fresh-tokens",
+        action="store_true",
+        help="sign a new token for every request instead of reusing one",
+    )
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, workdir):
+    # Read by the functions modules when they are imported.
+    os.chdir(workdir)
+    os.environ.update(
+        {
+            "GITHUB_ACCESS_TOKEN": "benchmark",
+            "AUTH0_DOMAIN": AUTH0_DOMAIN,
+            "API_AUDIENCE": API_AUDIENCE,
+            "PERMISSION": PERMISSION,
+            "DB_PUBLISH_MODE": args.publish_mode,
+            "REQUEST_TIMING_ENABLED": "true",
+        }
+    )
+    os.environ.pop("RUNNING_IN_AZURE", None)
+    # Requests are sent one at a time, waiting for others to share a push
+    # would only add the window to every write.
+    os.environ.setdefault("PUSH_COALESCE_WINDOW", "0")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with TemporaryDirectory() as workdir:
+        configure_environment(args, workdir)
+
+        from .fake_auth import FakeAuth0
+
+        auth0 = FakeAuth0(AUTH0_DOMAIN, API_AUDIENCE).start()
+        os.environ["JWKS_URL"] = auth0.jwks_url
+        try:
+            for meeting_count in args.meetings:
+                run_benchmark(args, workdir, auth0, meeting_count)
+        finally:
+            auth0.stop()
+
+
+def run_benchmark(args, workdir, auth0, meeting_count):
+    from functions import github, models
+    from functions.dashboard import main as dashboard
+    from .fake_github import FakeGitHub
+    from .seed import seed_database
+
+    seed_path = os.path.join(workdir, f"seed-{meeting_count}.db")
+    seed_database(seed_path, meeting_count)
+    with open(seed_path, "rb") as seed_file:
+        seed_content = seed_file.read()
+    fake_github = FakeGitHub(latency=args.github_latency / 1000).start()
+    fake_github.publish({github.DB_FILE_PATH: seed_content})
+    reset_instance(fake_github.base_url)
+
+    print(
+        f"\n{meeting_count} meetings, {len(seed_content) // 1024} KiB database,"
+        f" {'in-memory' if models.DB_IN_MEMORY else 'file'} storage,"
+        f" {args.publish_mode} mode, {args.github_latency:g} ms GitHub latency"
+    )
+    print(
+        f"{'endpoint':<28}{'p50':>8}{'p90':>8}{'p99':>8}{'max':>8}"
+        + "".join(f"{phase:>10}" for phase in PHASES)
+        + f"{'sql':>8}{'github':>8}{'errors':>8}"
+    )
+    token = auth0.sign_token([PERMISSION])
+    # One loop for every request, like the worker's.
+    loop = asyncio.new_event_loop()
+    try:
+        for scenario in scenarios(meeting_count, args.requests):
+            latencies, phase_totals, errors = [], Counter(), 0
+            github_requests = fake_github.request_count
+            for request, expected_status in scenario["requests"]:
+                if args.fresh_tokens:
+                    token = auth0.sign_token([PERMISSION])
+                start = perf_counter()
+                response = loop.run_until_complete(
+                    dashboard.main(build_request(token, *request))
+                )
+                latencies.append(perf_counter() - start)
+                errors += response.status_code != expected_status
+                phase_totals.update(
+                    parse_server_timing(response.headers["Server-Timing"])
+                )
+            print_row(
+                scenario["name"],
+                latencies,
+                phase_totals,
+                (fake_github.request_count - github_requests) / len(latencies),
+                errors,
+            )
+    finally:
+        loop.close()
+        fake_github.stop()
+
+
+def reset_instance(github_api_url):
+    """Start from the state of a freshly started instance."""
+    from functions import github, models
+    from functions.dashboard.projections import ACTIVE_MEETINGS
+
+    github.GITHUB_API_URL = github_api_url
+    github.get_github.cache_clear()
+    github.get_repo.cache_clear()
+    github.rate_limit = github.RateLimitBudget(
+        github.GITHUB_BUDGET_DEGRADED_FRACTION, github.GITHUB_BUDGET_WRITE_RESERVE
+    )
+    github._branch_ref = None
+    github._local_commit_sha = None
+    github._local_db_file_metadata = None
+    github._local_db_version = None
+    github._last_synced_at = None
+    models.session.remove()
+    models.delete_local_db()
+    ACTIVE_MEETINGS.invalidate()
+
+
+def scenarios(meeting_count, request_count):
+    """Yield the endpoints to measure with their requests and expected status."""
+
+    def repeat(request, expected_status=200):
+        return [(request(index), expected_status) for index in range(request_count)]
+
+    def new_meeting(index):
+        return {
+            "roomName": f"Benchmark {uuid4().hex}",
+            "participants": [f"Participant {index + offset}" for offset in (1, 2, 3)],
+            "labels": [f"Label {index % 20 + 1}"],
+        }
+
+    yield {
+        "name": "GET active meetings",
+        "requests": repeat(lambda index: ("GET", "meetings", None, None, {})),
+    }
+    yield {
+        "name": "GET history page",
+        "requests": repeat(
+            lambda index: (
+                "GET",
+                "meetings",
+                None,
+                None,
+                {"status": "ended", "limit": "50"},
+            )
+        ),
+    }
+    yield {
+        "name": "GET participant history",
+        "requests": repeat(
+            lambda index: (
+                "GET",
+                "meetings",
+                None,
+                None,
+                {"participant": f"Participant {index + 1}", "limit": "50"},
+            )
+        ),
+    }
+    yield {
+        "name": "POST meeting",
+        "requests": repeat(
+            lambda index: ("POST", "meetings", None, new_meeting(index), {}), 201
+        ),
+    }
+    yield {
+        "name": "PATCH meeting",
+        "requests": repeat(
+            lambda index: (
+                "PATCH",
+                "meetings",
+                meeting_count - index,
+                {"labels": ["Label 1"]},
+                {},
+            ),
+            201,
+        ),
+    }
+    yield {
+        "name": "POST batch of 100 meetings",
+        "requests": repeat(
+            lambda index: (
+                "POST",
+                "meetings",
+                None,
+                [new_meeting(index) for _ in range(100)],
+                {},
+            )
+        ),
+    }
+    yield {
+        "name": "DELETE meeting",
+        "requests": repeat(lambda index: ("DELETE", "meetings", index + 1, None, {})),
+    }
+
+
+def build_request(token, method, resource, resource_id, body, params, headers=None):
+    route_params = {"resources": resource}
+    if resource_id is not None:
+        route_params["id"] = str(resource_id)
+    return func.HttpRequest(
+        method,
+        f"http://localhost/api/dashboard/{resource}",
+        headers={"Authorization": f"Bearer {token}", **(headers or {})},
+        params=params,
+        route_params=route_params,
+        body=b"" if body is None else dumps(body).encode(),
+    )
+
+
+def parse_server_timing(header):
+    """Return the phases in seconds and the SQL counts of a response."""
+    metrics = {}
+    for metric in header.split(", "):
+        name, _, parameter = metric.partition(";")
+        key, _, value = parameter.partition("=")
+        metrics[name] = float(value) / 1000 if key == "dur" else int(value.strip('"'))
+    phases = {phase: metrics.get(phase, 0) for phase in PHASES if phase != "query"}
+    # SQL statements run during the other phases too, so they aren't a phase.
+    phases["query"] = metrics["total"] - sum(phases.values())
+    phases["sql_statements"] = metrics.get("sql_statements", 0)
+    phases["sql_commits"] = metrics.get("sql_commits", 0)
+    return phases
+
+
+def print_row(name, latencies, phase_totals, github_requests, errors):
+    latencies = sorted(latencies)
+
+    def percentile(percent):
+        index = max(0, -(-len(latencies) * percent // 100) - 1)
+        return f"{latencies[index] * 1000:>8.1f}"
+
+    print(
+        f"{name:<28}{percentile(50)}{percentile(90)}{percentile(99)}{percentile(100)}"
+        + "".join(
+            f"{phase_totals[phase] / len(latencies) * 1000:>10.2f}" for phase in PHASES
+        )
+        + f"{phase_totals['sql_statements'] / len(latencies):>8.1f}"
+        + f"{github_requests:>8.1f}{errors:>8}",
+        flush=True,
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
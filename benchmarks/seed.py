@@ -0,0 +1,88 @@
+"""Databases of a given number of meetings, shaped like the production one."""
+
+import sqlite3
+from datetime import datetime, timedelta
+from random import Random
+
+from sqlalchemy import create_engine
+
+from functions.models import (
+    SCHEMA_VERSION,
+    Base,
+    rebuild_search_index,
+    rebuild_stats,
+)
+
+LABEL_COUNT = 20
+
+
+def seed_database(path, meeting_count, active_count=20, seed=0):
+    """Write a database of ``meeting_count`` meetings, the last ones active.
+
+    There is a participant for every 10 meetings, each meeting has 3 to 8
+    participants and 1 to 3 labels, and meetings start 15 minutes apart.
+    """
+    random = Random(seed)
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    participant_count = max(50, meeting_count // 10)
+    first_start = datetime(2021, 1, 1) - timedelta(minutes=15 * meeting_count)
+    meetings, meetings_participants, meetings_labels = [], [], []
+    for meeting_id in range(1, meeting_count + 1):
+        date_started = first_start + timedelta(minutes=15 * meeting_id)
+        is_active = meeting_id > meeting_count - active_count
+        date_ended = None if is_active else date_started + timedelta(minutes=45)
+        meetings.append(
+            (
+                meeting_id,
+                f"Room {meeting_id}",
+                format_date(date_started),
+                date_ended and format_date(date_ended),
+                f"https://meet.jit.si/room-{meeting_id}",
+            )
+        )
+        for participant_id in random.sample(
+            range(1, participant_count + 1), random.randint(3, 8)
+        ):
+            meetings_participants.append((meeting_id, participant_id))
+        for label_id in random.sample(range(1, LABEL_COUNT + 1), random.randint(1, 3)):
+            meetings_labels.append((meeting_id, label_id))
+
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.executemany(
+            "INSERT INTO participant (id, name) VALUES (?, ?)",
+            [
+                (index, f"Participant {index}")
+                for index in range(1, participant_count + 1)
+            ],
+        )
+        connection.executemany(
+            "INSERT INTO label (id, name) VALUES (?, ?)",
+            [(index, f"Label {index}") for index in range(1, LABEL_COUNT + 1)],
+        )
+        connection.executemany(
+            "INSERT INTO meeting (id, name, date_started, date_ended, link)"
+            " VALUES (?, ?, ?, ?, ?)",
+            meetings,
+        )
+        connection.executemany(
+            "INSERT INTO meetings_participants VALUES (?, ?)", meetings_participants
+        )
+        connection.executemany(
+            "INSERT INTO meetings_labels VALUES (?, ?)", meetings_labels
+        )
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as engine_connection:
+        rebuild_stats(engine_connection)
+        rebuild_search_index(engine_connection)
+        engine_connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    engine.dispose()
+    connection.close()
+
+
+def format_date(date):
+    # The way SQLAlchemy stores DateTime columns in SQLite.
+    return date.strftime("%Y-%m-%d %H:%M:%S.%f")
@@ -0,0 +1,204 @@
+"""Check how many SQL statements and commits each write request runs, offline.
+
+A write runs in a single transaction committed once, right before its push,
+and the statements it runs don't depend on the size of the database or on
+how many participants and labels it names. Each request below must stay
+within its statement budget, read from the Server-Timing header. Run it from
+the repository root:
+
+    python -m benchmarks.statements
+
+The budgets count on SQLite 3.35 or later, which inserts new names with a
+single statement. It exits with a non-zero status when anything is off.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from tempfile import TemporaryDirectory
+
+from .run import (
+    API_AUDIENCE,
+    AUTH0_DOMAIN,
+    PERMISSION,
+    build_request,
+    configure_environment,
+    parse_server_timing,
+    reset_instance,
+)
+
+SEEDED_MEETINGS = 1000
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--meetings", type=int, default=SEEDED_MEETINGS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with TemporaryDirectory() as workdir:
+        configure_environment(argparse.Namespace(publish_mode="file"), workdir)
+
+        from .fake_auth import FakeAuth0
+
+        auth0 = FakeAuth0(AUTH0_DOMAIN, API_AUDIENCE).start()
+        os.environ["JWKS_URL"] = auth0.jwks_url
+        try:
+            problems = run_check(args, workdir, auth0)
+        finally:
+            auth0.stop()
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} problems")
+    return 1 if problems else 0
+
+
+def run_check(args, workdir, auth0):
+    from functions import github
+    from functions.dashboard import main as dashboard
+    from .fake_github import FakeGitHub
+    from .seed import seed_database
+
+    seed_path = os.path.join(workdir, "seed.db")
+    seed_database(seed_path, args.meetings)
+    fake_github = FakeGitHub().start()
+    with open(seed_path, "rb") as seed_file:
+        fake_github.publish({github.DB_FILE_PATH: seed_file.read()})
+    reset_instance(fake_github.base_url)
+
+    token = auth0.sign_token([PERMISSION])
+    loop = asyncio.new_event_loop()
+    problems = []
+    print(f"{'request':<44}{'sql':>8}{'budget':>8}{'commits':>8}")
+    try:
+        # Clones the database, which isn't part of any write.
+        loop.run_until_complete(
+            dashboard.main(build_request(token, "GET", "meetings", None, None, {}))
+        )
+        for name, request, expected_status, budget, commits in write_requests(
+            args.meetings
+        ):
+            response = loop.run_until_complete(
+                dashboard.main(build_request(token, *request))
+            )
+            timings = parse_server_timing(response.headers["Server-Timing"])
+            statements = timings["sql_statements"]
+            print(
+                f"{name:<44}{statements:>8}{budget:>8}{timings['sql_commits']:>8}",
+                flush=True,
+            )
+            if response.status_code != expected_status:
+                problems.append(
+                    f"{name}: got {response.status_code},"
+                    f" expected {expected_status}"
+                )
+            if statements > budget:
+                problems.append(f"{name}: {statements} statements, over {budget}")
+            if timings["sql_commits"] != commits:
+                problems.append(
+                    f"{name}: {timings['sql_commits']} commits, expected {commits}"
+                )
+    finally:
+        loop.close()
+        fake_github.stop()
+    return problems
+
+
+def write_requests(meeting_count):
+    """Yield each write with its expected status, statement budget and commits.
+
+    A budget counts the BEGIN and the schema version pragma every write runs.
+    """
+
+    def new_meeting(name, participant_names):
+        return {
+            "roomName": name,
+            "participants": participant_names,
+            "labels": ["Label 1", "Label 2", "Checked label"],
+        }
+
+    existing = [f"Participant {number}" for number in range(1, 31)]
+    new = [f"Checked participant {number}" for number in range(1, 31)]
+    yield (
+        "POST meeting, 30 existing participants",
+        ("POST", "meetings", None, new_meeting("Checked 1", existing), {}),
+        201,
+        16,
+        1,
+    )
+    yield (
+        "POST meeting, 30 new participants",
+        ("POST", "meetings", None, new_meeting("Checked 2", new), {}),
+        201,
+        16,
+        1,
+    )
+    yield (
+        "PATCH meeting",
+        (
+            "PATCH",
+            "meetings",
+            meeting_count,
+            {"endingFlag": True, "participants": existing, "labels": ["Label 3"]},
+            {},
+        ),
+        201,
+        18,
+        1,
+    )
+    yield (
+        "DELETE meeting",
+        ("DELETE", "meetings", 1, None, {}),
+        200,
+        16,
+        1,
+    )
+    yield (
+        "POST participant",
+        ("POST", "participants", None, {"name": "Checked participant"}, {}),
+        201,
+        3,
+        1,
+    )
+    yield (
+        "PATCH label",
+        ("PATCH", "labels", 1, {"name": "Checked label 1"}, {}),
+        201,
+        7,
+        1,
+    )
+    yield (
+        "DELETE a meeting that doesn't exist",
+        ("DELETE", "meetings", meeting_count * 2, None, {}),
+        404,
+        3,
+        0,
+    )
+    batch = [
+        new_meeting(f"Checked batch {number}", existing[number : number + 3])
+        for number in range(10)
+    ]
+    yield (
+        "POST batch of 10 meetings",
+        ("POST", "meetings", None, batch, {}),
+        200,
+        153,
+        1,
+    )
+    idempotent = (
+        "POST",
+        "meetings",
+        None,
+        new_meeting("Checked 3", existing),
+        {},
+        {"Idempotency-Key": "statements-check"},
+    )
+    yield ("POST meeting with an Idempotency-Key", idempotent, 201, 18, 1)
+    yield ("POST meeting retried with the same key", idempotent, 201, 0, 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
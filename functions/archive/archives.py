@@ -0,0 +1,251 @@
+"""Ended meetings moved out of database.db into yearly archive databases.
+
+Every write clones and pushes the whole database.db and the dashboard reads
+it from gh-pages, while almost every request is about active and recent
+meetings. Meetings that ended before the cutoff are moved, along with their
+participants and labels, to ``archives/meetings-<year>.db`` on gh-pages, by
+the year they started in. ``archives/manifest.json`` lists the archives so
+the dashboard can attach the ones a query needs:
+
+    {
+      "archivedBefore": "2021-01-01T00:00:00",
+      "archives": [
+        {
+          "path": "archives/meetings-2020.db",
+          "period": "2020",
+          "meetings": 1200,
+          "firstStarted": "2020-01-02 10:00:00.000000",
+          "lastStarted": "2020-12-30 16:15:00.000000",
+          "size": 262144
+        }
+      ]
+    }
+
+An archive has the same schema as database.db, with summary tables and a
+search index of its own meetings. The summary tables of database.db keep
+counting the archived meetings, so the dashboard's statistics still cover the
+whole history, and what they add is recorded in the archived_* tables for
+rebuild_stats to count them again.
+"""
+
+import logging
+from itertools import groupby
+from json import dumps, loads
+from os import getenv
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from sqlalchemy import create_engine, delete, select, text
+
+from ..github import (
+    DB_HTTPVFS_PAGE_SIZE,
+    DB_OPTIMIZE_FOR_HTTPVFS,
+    read_batch_file,
+    stage_file,
+)
+from ..github.httpvfs import optimize
+from ..models import (
+    SCHEMA_VERSION,
+    Base,
+    Label,
+    Meeting,
+    Participant,
+    add_archived_stats,
+    create_tables,
+    labels_association_table,
+    meeting_search,
+    participants_association_table,
+    rebuild_search_index,
+    rebuild_stats,
+    session,
+    vacuum_local_db,
+)
+
+ARCHIVE_DIR = getenv("ARCHIVE_DIR", "archives")
+MANIFEST_PATH = f"{ARCHIVE_DIR}/manifest.json"
+
+
+def archive_meetings(cutoff):
+    """Move the meetings that ended before ``cutoff`` to their yearly archive.
+
+    Meant to run through commit_operation, which pushes the archives and the
+    manifest staged here along with database.db. Return the number of
+    meetings archived.
+    """
+    create_tables()
+    if not meeting_ids_are_never_reused():
+        # A new meeting could take the id of an archived one.
+        logging.warning(
+            "The meeting table doesn't use AUTOINCREMENT yet, apply the"
+            " migrations before archiving"
+        )
+        return 0
+    archived_ids = select(Meeting.id).where(
+        Meeting.date_ended.is_not(None), Meeting.date_ended < cutoff
+    )
+    meetings = (
+        session.execute(
+            select(Meeting.__table__)
+            .where(Meeting.id.in_(archived_ids))
+            .order_by(Meeting.date_started, Meeting.id)
+        )
+        .mappings()
+        .all()
+    )
+    if not meetings:
+        return 0
+    meetings_participants = select_rows(
+        participants_association_table,
+        participants_association_table.c.meeting_id.in_(archived_ids),
+    )
+    meetings_labels = select_rows(
+        labels_association_table,
+        labels_association_table.c.meeting_id.in_(archived_ids),
+    )
+    participants = {
+        row["id"]: row
+        for row in select_rows(
+            Participant.__table__,
+            Participant.id.in_(
+                select(participants_association_table.c.participant_id).where(
+                    participants_association_table.c.meeting_id.in_(archived_ids)
+                )
+            ),
+        )
+    }
+    labels = {
+        row["id"]: row
+        for row in select_rows(
+            Label.__table__,
+            Label.id.in_(
+                select(labels_association_table.c.label_id).where(
+                    labels_association_table.c.meeting_id.in_(archived_ids)
+                )
+            ),
+        )
+    }
+
+    manifest = read_manifest()
+    entries = {entry["period"]: entry for entry in manifest["archives"]}
+    for period, period_meetings in groupby(
+        meetings, lambda meeting: str(meeting["date_started"].year)
+    ):
+        period_meetings = list(period_meetings)
+        meeting_ids = {meeting["id"] for meeting in period_meetings}
+        period_participants = [
+            row for row in meetings_participants if row["meeting_id"] in meeting_ids
+        ]
+        period_labels = [
+            row for row in meetings_labels if row["meeting_id"] in meeting_ids
+        ]
+        path = f"{ARCHIVE_DIR}/meetings-{period}.db"
+        content, summary = build_archive(
+            read_batch_file(path),
+            {
+                Participant.__table__: [
+                    participants[participant_id]
+                    for participant_id in {
+                        row["participant_id"] for row in period_participants
+                    }
+                ],
+                Label.__table__: [
+                    labels[label_id]
+                    for label_id in {row["label_id"] for row in period_labels}
+                ],
+                Meeting.__table__: period_meetings,
+                participants_association_table: period_participants,
+                labels_association_table: period_labels,
+            },
+        )
+        stage_file(path, content)
+        entries[period] = {
+            "path": path,
+            "period": period,
+            "size": len(content),
+            **summary,
+        }
+
+    add_archived_stats(archived_ids)
+    session.execute(
+        delete(participants_association_table).where(
+            participants_association_table.c.meeting_id.in_(archived_ids)
+        )
+    )
+    session.execute(
+        delete(labels_association_table).where(
+            labels_association_table.c.meeting_id.in_(archived_ids)
+        )
+    )
+    session.execute(
+        delete(meeting_search).where(meeting_search.c.rowid.in_(archived_ids))
+    )
+    session.execute(delete(Meeting).where(Meeting.id.in_(archived_ids)))
+    session.commit()
+    session.close()
+    # The push rewrites the database for sql.js-httpvfs with a VACUUM anyway.
+    if not DB_OPTIMIZE_FOR_HTTPVFS:
+        vacuum_local_db()
+
+    manifest["archivedBefore"] = max(manifest["archivedBefore"], cutoff.isoformat())
+    manifest["archives"] = [entries[period] for period in sorted(entries)]
+    stage_file(MANIFEST_PATH, dumps(manifest, indent=2).encode())
+    return len(meetings)
+
+
+def meeting_ids_are_never_reused():
+    table_sql = session.execute(
+        text("SELECT sql FROM sqlite_master WHERE name = 'meeting'")
+    ).scalar_one()
+    return "AUTOINCREMENT" in table_sql.upper()
+
+
+def select_rows(table, condition):
+    return session.execute(select(table).where(condition)).mappings().all()
+
+
+def read_manifest():
+    content = read_batch_file(MANIFEST_PATH)
+    if content is None:
+        return {"archivedBefore": "", "archives": []}
+    return loads(content)
+
+
+def build_archive(content, rows):
+    """Add ``rows``, a dict of table to rows, to the archive database ``content``.
+
+    ``content`` is None for a new archive. Return the archive rewritten for
+    sql.js-httpvfs, with the manifest fields summing up its meetings.
+    """
+    with TemporaryDirectory() as directory:
+        path = Path(directory).joinpath("archive.db")
+        if content is not None:
+            path.write_bytes(content)
+        engine = create_engine(f"sqlite:///{path}")
+        try:
+            with engine.begin() as connection:
+                Base.metadata.create_all(connection)
+                for table, table_rows in rows.items():
+                    if not table_rows:
+                        continue
+                    statement = table.insert()
+                    if table.name in ("participant", "label"):
+                        # They may be in the archive already.
+                        statement = statement.prefix_with("OR IGNORE")
+                    connection.execute(statement, table_rows)
+                rebuild_stats(connection)
+                rebuild_search_index(connection)
+                connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                meeting_count, first_started, last_started = connection.exec_driver_sql(
+                    "SELECT COUNT(*), MIN(date_started), MAX(date_started)"
+                    " FROM meeting"
+                ).one()
+        finally:
+            engine.dispose()
+        # Archives are only read by the dashboard, with HTTP range requests.
+        optimize(path, DB_HTTPVFS_PAGE_SIZE)
+        summary = {
+            "meetings": meeting_count,
+            "firstStarted": first_started,
+            "lastStarted": last_started,
+        }
+        return path.read_bytes(), summary
@@ -0,0 +1,24 @@
+import logging
+from datetime import datetime, timedelta
+from functools import partial
+from os import getenv
+
+import azure.functions as func
+
+# Meetings that ended this many days ago or earlier are archived.
+ARCHIVE_AFTER_DAYS = int(getenv("ARCHIVE_AFTER_DAYS", 90))
+
+
+def main(timer: func.TimerRequest) -> None:
+    # The worker imports every function when the host starts, SQLAlchemy and
+    # PyGithub are only loaded once the timer fires.
+    from ..github import commit_operation
+    from ..models import session
+    from .archives import archive_meetings
+
+    cutoff = datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    try:
+        archived = commit_operation(partial(archive_meetings, cutoff))
+    finally:
+        session.remove()
+    logging.info("Archived %s meetings that ended before %s", archived, cutoff)
@@ -1,13 +1,29 @@
 import os
 import json
+import logging
+import threading
+from collections import OrderedDict
+from hashlib import sha256
+from time import monotonic, time
 from typing import Tuple, Union
 from urllib.request import urlopen
-from jose import jwt
+
+from ..timing import timed
 
 AUTH0_DOMAIN = os.getenv("AUTH0_DOMAIN")
 API_AUDIENCE = os.getenv("API_AUDIENCE")
 ALGORITHMS = ["RS256"]
 PERMISSION = os.getenv("PERMISSION")
+JWKS_URL = os.getenv("JWKS_URL", f"https://{AUTH0_DOMAIN}/.well-known/jwks.json")
+
+# Keys younger than JWKS_CACHE_TTL seconds are used as is, keys younger than
+# JWKS_STALE_TTL are served while a background refresh runs, anything older
+# is refreshed before the token is verified.
+JWKS_CACHE_TTL = int(os.getenv("JWKS_CACHE_TTL", 600))
+JWKS_STALE_TTL = int(os.getenv("JWKS_STALE_TTL", 86400))
+JWKS_REFRESH_COOLDOWN = int(os.getenv("JWKS_REFRESH_COOLDOWN", 30))
+JWKS_FETCH_TIMEOUT = float(os.getenv("JWKS_FETCH_TIMEOUT", 5))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 256))
 
 
 class AuthError:
@@ -16,6 +32,169 @@ class AuthError:
         self.status_code = status_code
 
 
+class JWKSCache:
+    """Auth0 signing keys parsed once and indexed by ``kid``.
+
+    A warm instance reuses the keys between invocations, an unknown ``kid``
+    forces a refresh at most once every ``refresh_cooldown`` seconds and a
+    failed refresh keeps serving the keys fetched previously.
+    """
+
+    def __init__(self, url, ttl, stale_ttl, refresh_cooldown, timeout):
+        self.url = url
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.refresh_cooldown = refresh_cooldown
+        self.timeout = timeout
+        self.keys = {}
+        self.fetched_at = None
+        self.last_attempt = None
+        self._lock = threading.Lock()
+        # Held while fetching, so concurrent callers wait for the fetch in
+        # flight and use its keys instead of failing on the cooldown.
+        self._fetch_lock = threading.Lock()
+        self._background_refresh = None
+
+    def get_key(self, kid):
+        age = self._age()
+        if age is None or age > self.stale_ttl:
+            self.refresh()
+        elif age > self.ttl:
+            self._refresh_in_background()
+
+        key = self.keys.get(kid)
+        if key is None:
+            # A refresh that was already running returns False once it is
+            # done, its keys may hold the kid all the same.
+            self.refresh()
+            key = self.keys.get(kid)
+        return key
+
+    def has_key(self, kid):
+        """Whether ``kid`` is in a key set recent enough to trust, without waiting.
+
+        Like get_key, keys past the TTL are refreshed in the background, but
+        keys past the stale TTL are not trusted rather than waited for.
+        """
+        age = self._age()
+        if age is None or age > self.stale_ttl:
+            return False
+        if age > self.ttl:
+            self._refresh_in_background()
+        return kid in self.keys
+
+    def refresh(self) -> bool:
+        """Fetch the key set unless the last attempt is within the cooldown."""
+        with self._fetch_lock:
+            with self._lock:
+                now = monotonic()
+                if (
+                    self.last_attempt is not None
+                    and now - self.last_attempt < self.refresh_cooldown
+                ):
+                    return False
+                self.last_attempt = now
+            try:
+                keys = self._fetch()
+            except Exception:
+                logging.exception("Unable to refresh the JWKS from %s", self.url)
+                return False
+            self.keys = keys
+            self.fetched_at = monotonic()
+            return True
+
+    @timed("jwks")
+    def _fetch(self):
+        from jose import jwk
+
+        with urlopen(self.url, timeout=self.timeout) as jsonurl:
+            jwks = json.loads(jsonurl.read())
+
+        # Those key properties are used to verify the JWT signature.
+        # For extra info refer to: https://auth0.com/docs/tokens/json-web-tokens/json-web-key-set-properties
+        keys = {}
+        for key in jwks["keys"]:
+            rsa_key = {
+                "kty": key["kty"],
+                "kid": key["kid"],
+                "use": key["use"],
+                "n": key["n"],
+                "e": key["e"],
+            }
+            keys[key["kid"]] = jwk.construct(rsa_key, ALGORITHMS[0])
+        return keys
+
+    def _age(self):
+        if self.fetched_at is None:
+            return None
+        return monotonic() - self.fetched_at
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._background_refresh and self._background_refresh.is_alive():
+                return
+            self._background_refresh = threading.Thread(
+                target=self.refresh, daemon=True
+            )
+            self._background_refresh.start()
+
+
+class TokenCache:
+    """Bounded LRU of verified token payloads keyed by the token's hash.
+
+    An entry is only returned while the token hasn't expired and the key that
+    signed it is still published, so rotated keys revoke cached tokens too.
+    Hits age the key set like get_key does, a token whose key set is too old
+    to trust goes through full verification again.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hash(token):
+        return sha256(token.encode()).hexdigest()
+
+    def get(self, token, jwks_cache):
+        token_hash = self._hash(token)
+        with self._lock:
+            entry = self._entries.get(token_hash)
+            if entry is None:
+                return None
+            payload, kid, expires_at = entry
+            if expires_at <= time() or not jwks_cache.has_key(kid):
+                del self._entries[token_hash]
+                return None
+            self._entries.move_to_end(token_hash)
+            return payload
+
+    def put(self, token, kid, payload):
+        expires_at = payload.get("exp")
+        if not isinstance(expires_at, (int, float)) or self.max_size <= 0:
+            return
+        token_hash = self._hash(token)
+        with self._lock:
+            self._entries[token_hash] = (payload, kid, expires_at)
+            self._entries.move_to_end(token_hash)
+            now = time()
+            for cached_hash in [h for h, e in self._entries.items() if e[2] <= now]:
+                del self._entries[cached_hash]
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+JWKS_CACHE = JWKSCache(
+    JWKS_URL,
+    JWKS_CACHE_TTL,
+    JWKS_STALE_TTL,
+    JWKS_REFRESH_COOLDOWN,
+    JWKS_FETCH_TIMEOUT,
+)
+TOKEN_CACHE = TokenCache(TOKEN_CACHE_SIZE)
+
+
 def get_token_from_auth_header(req) -> Tuple[str, Union[AuthError, None]]:
     auth_header = req.headers.__http_headers__.get("authorization", "")
     if not auth_header:
@@ -39,8 +218,13 @@ def check_permissions(permission, payload) -> Union[AuthError, None]:
 
 
 def verify_decode_jwt(token) -> Tuple[dict, Union[AuthError, None]]:
-    jsonurl = urlopen(f"https://{AUTH0_DOMAIN}/.well-known/jwks.json")
-    jwks = json.loads(jsonurl.read())
+    cached_payload = TOKEN_CACHE.get(token, JWKS_CACHE)
+    if cached_payload is not None:
+        return (cached_payload, None)
+
+    # Imported here so requests without a token never load jose.
+    from jose import jwt
+
     try:
         unverified_header = jwt.get_unverified_header(token)
     except Exception:
@@ -48,22 +232,11 @@ def verify_decode_jwt(token) -> Tuple[dict, Union[AuthError, None]]:
             {},
             AuthError("Invalid Header: Unable to parse authentication token", 400),
         )
-    rsa_key = {}
     if "kid" not in unverified_header:
         return ({}, AuthError("Invalid Header: Authorization malformed.", 401))
 
     # Checks if the JWT token is a valid token signed by Auth0 serivce.
-    # Those key properties are used to verify the JWT signature.
-    # For extra info refer to: https://auth0.com/docs/tokens/json-web-tokens/json-web-key-set-properties
-    for key in jwks["keys"]:
-        if key["kid"] == unverified_header["kid"]:
-            rsa_key = {
-                "kty": key["kty"],
-                "kid": key["kid"],
-                "use": key["use"],
-                "n": key["n"],
-                "e": key["e"],
-            }
+    rsa_key = JWKS_CACHE.get_key(unverified_header["kid"])
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -73,6 +246,7 @@ def verify_decode_jwt(token) -> Tuple[dict, Union[AuthError, None]]:
                 audience=API_AUDIENCE,
                 issuer="https://" + AUTH0_DOMAIN + "/",
             )
+            TOKEN_CACHE.put(token, unverified_header["kid"], payload)
 
             return (payload, None)
 
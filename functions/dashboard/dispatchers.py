@@ -0,0 +1,732 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from functools import partial
+from os import getenv
+from typing import Union
+from json import dumps
+from sqlalchemy import and_, insert, or_, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import selectinload
+import azure.functions as func
+
+from ..models import (
+    Label,
+    Participant,
+    Meeting,
+    MeetingStats,
+    create_tables,
+    delete_stats,
+    engine,
+    labels_association_table,
+    participants_association_table,
+    search_index_exists,
+    select_matching_meeting_ids,
+    session,
+    update_meeting_stats,
+    update_search_index,
+)
+from ..github import (
+    RateLimitExhausted,
+    clone_db_file,
+    commit_operation,
+    get_local_db_version,
+)
+from ..timing import record_sql, timed
+from .idempotency import (
+    IDEMPOTENT_RESPONSES,
+    find_stored_response,
+    get_idempotency_key,
+    replay_response,
+    request_fingerprint,
+    store_response,
+)
+from .projections import ACTIVE_MEETINGS
+
+record_sql(engine)
+
+RESOURCE_TO_MODEL_MAPPER = {
+    "meetings": Meeting,
+    "participants": Participant,
+    "labels": Label,
+}
+# Seconds the active meetings may lag behind gh-pages before a GET checks it.
+ACTIVE_MEETINGS_MAX_AGE = float(getenv("ACTIVE_MEETINGS_MAX_AGE", 5))
+# Any of these query parameters switches GET dashboard/meetings from the
+# active meetings to browsing the meetings history.
+HISTORY_PARAMS = {
+    "status",
+    "from",
+    "to",
+    "label",
+    "participant",
+    "q",
+    "cursor",
+    "limit",
+}
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 500
+# Items a single batch request may create, update or delete.
+BATCH_MAX_ITEMS = int(getenv("BATCH_MAX_ITEMS", 1000))
+
+
+def get_dispatcher(request):
+    GET_RESOURCES = ["secrets", "meetings"]
+    resource = request.route_params.get("resources")
+    if resource not in GET_RESOURCES:
+        return func.HttpResponse(
+            dumps({"message": "Method Not Allowed"}),
+            status_code=405,
+            mimetype="application/json",
+        )
+
+    elif resource == "secrets":
+        secret_type = request.params.get("type", None)
+        if secret_type is None:
+            return func.HttpResponse(
+                dumps({"message": "Bad Request"}),
+                status_code=400,
+                mimetype="application/json",
+            )
+        secret = getenv(secret_type.upper(), None)
+        if secret:
+            return func.HttpResponse(
+                dumps({"secret": secret}), status_code=200, mimetype="application/json"
+            )
+        else:
+            return func.HttpResponse(
+                dumps({"message": "Secret not found"}),
+                status_code=404,
+                mimetype="application/json",
+            )
+
+    elif resource == "meetings":
+        if request.route_params.get("id", None):
+            return func.HttpResponse(
+                dumps({"message": "Method Not Allowed"}),
+                status_code=405,
+                mimetype="application/json",
+            )
+
+        if HISTORY_PARAMS.intersection(request.params):
+            return get_meetings_history(request.params)
+
+        clone_db_file(max_age=ACTIVE_MEETINGS_MAX_AGE)
+        db_version = get_local_db_version()
+        if not ACTIVE_MEETINGS.is_current(db_version):
+            active_meetings = (
+                session.query(Meeting).filter(Meeting.date_ended == None).all()
+            )
+            ACTIVE_MEETINGS.rebuild(
+                db_version, [serialize_meeting(meeting) for meeting in active_meetings]
+            )
+
+        active_meetings_body = ACTIVE_MEETINGS.body()
+        if not active_meetings_body:
+            return func.HttpResponse(
+                dumps({"message": "There are no active meetings"}),
+                status_code=404,
+                mimetype="application/json",
+            )
+        return func.HttpResponse(
+            active_meetings_body,
+            status_code=200,
+            mimetype="application/json",
+        )
+
+
+def rate_limit_exhausted_response(error):
+    return func.HttpResponse(
+        dumps({"message": "GitHub API rate limit exhausted, try again later"}),
+        status_code=503,
+        headers={"Retry-After": str(error.retry_after())},
+        mimetype="application/json",
+    )
+
+
+def prefetch_db_file():
+    """Clone the database GET meetings reads before the request is authorized.
+
+    It is synced within ACTIVE_MEETINGS_MAX_AGE, so the dispatcher uses it as
+    is, unless reads always check GitHub.
+    """
+    if ACTIVE_MEETINGS_MAX_AGE > 0:
+        clone_db_file(max_age=ACTIVE_MEETINGS_MAX_AGE)
+
+
+def get_meetings_history(params):
+    """Return one page of meetings, most recently started first, as NDJSON.
+
+    Filters are ``status`` (active, ended or all), ``from``/``to`` bounds on
+    the start date, ``label`` and ``participant`` names, and ``q``, words
+    the meeting's name, participants or labels start with. Pages are cut with a
+    keyset on ``(date_started, id)``, the cursor of the next one is sent in
+    the X-Next-Cursor header, so deep pages cost the same as the first one.
+    """
+    try:
+        query = filter_meetings_history(session.query(Meeting), params)
+        limit = int(params.get("limit", HISTORY_DEFAULT_LIMIT))
+        if not 0 < limit <= HISTORY_MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {HISTORY_MAX_LIMIT}")
+    except ValueError as e:
+        return func.HttpResponse(
+            dumps({"message": f"Bad Request: {e}"}),
+            status_code=400,
+            mimetype="application/json",
+        )
+
+    clone_db_file(max_age=ACTIVE_MEETINGS_MAX_AGE)
+    if "q" in params and not search_index_exists():
+        # Reads don't upgrade the database, the next write adds the index.
+        return func.HttpResponse(
+            dumps({"message": "Search isn't available until the database is upgraded"}),
+            status_code=503,
+            mimetype="application/json",
+        )
+    # Participants and labels of the whole page are loaded with one query
+    # each instead of two per meeting.
+    meetings = (
+        query.options(selectinload(Meeting.participants), selectinload(Meeting.labels))
+        .order_by(Meeting.date_started.desc(), Meeting.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    headers = {}
+    if len(meetings) > limit:
+        meetings = meetings[:limit]
+        headers["X-Next-Cursor"] = encode_history_cursor(meetings[-1])
+    return func.HttpResponse(
+        "".join(dumps(serialize_meeting(meeting)) + "\n" for meeting in meetings),
+        status_code=200,
+        headers=headers,
+        mimetype="application/x-ndjson",
+    )
+
+
+def filter_meetings_history(query, params):
+    status = params.get("status", "all")
+    if status == "active":
+        query = query.filter(Meeting.date_ended == None)
+    elif status == "ended":
+        query = query.filter(Meeting.date_ended != None)
+    elif status != "all":
+        raise ValueError("status must be active, ended or all")
+
+    if params.get("from"):
+        query = query.filter(
+            Meeting.date_started >= datetime.fromisoformat(params["from"])
+        )
+    if params.get("to"):
+        query = query.filter(
+            Meeting.date_started < datetime.fromisoformat(params["to"])
+        )
+    if params.get("label"):
+        query = query.filter(
+            Meeting.id.in_(
+                meeting_ids_linked_to(Label, labels_association_table, params["label"])
+            )
+        )
+    if params.get("participant"):
+        query = query.filter(
+            Meeting.id.in_(
+                meeting_ids_linked_to(
+                    Participant, participants_association_table, params["participant"]
+                )
+            )
+        )
+    if "q" in params:
+        matching_meeting_ids = select_matching_meeting_ids(params["q"])
+        if matching_meeting_ids is None:
+            raise ValueError("q must hold a word to search for")
+        query = query.filter(Meeting.id.in_(matching_meeting_ids))
+
+    if params.get("cursor"):
+        date_started, meeting_id = decode_history_cursor(params["cursor"])
+        query = query.filter(
+            or_(
+                Meeting.date_started < date_started,
+                and_(Meeting.date_started == date_started, Meeting.id < meeting_id),
+            )
+        )
+    return query
+
+
+def meeting_ids_linked_to(model, association_table, name):
+    """Select the ids of the meetings linked to the ``model`` row named ``name``.
+
+    Starting from the name walks the NOCASE name index and the reverse index of
+    the association table rather than checking every meeting.
+    """
+    foreign_key = association_table.c[f"{model.__tablename__}_id"]
+    return (
+        select(association_table.c.meeting_id)
+        .join(model, model.id == foreign_key)
+        .where(model.name.collate("NOCASE") == name)
+    )
+
+
+def encode_history_cursor(meeting):
+    cursor = f"{meeting.date_started.isoformat()}|{meeting.id}"
+    return urlsafe_b64encode(cursor.encode()).decode()
+
+
+def decode_history_cursor(cursor):
+    try:
+        date_started, meeting_id = urlsafe_b64decode(cursor).decode().split("|")
+        return datetime.fromisoformat(date_started), int(meeting_id)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+@timed("serialize")
+def serialize_resource(resource):
+    if isinstance(resource, Meeting):
+        return serialize_meeting(resource)
+    return {"id": resource.id, "name": resource.name}
+
+
+@timed("serialize")
+def serialize_meeting(meeting):
+    return {
+        "id": meeting.id,
+        "name": meeting.name,
+        "date_started": str(meeting.date_started),
+        "date_ended": str(meeting.date_ended) if meeting.date_ended else "",
+        "link": meeting.link,
+        "participants": [participant.name for participant in meeting.participants],
+        "labels": [label.name for label in meeting.labels],
+    }
+
+
+def post_dispatcher(request) -> Union[dict, None]:
+    resource = request.route_params.get("resources", None)
+    if not resource or request.route_params.get("id", None):
+        return func.HttpResponse(
+            dumps({"message": "Bad request"}),
+            status_code=400,
+            mimetype="application/json",
+        )
+
+    request_body = request.get_json()
+    model = RESOURCE_TO_MODEL_MAPPER[resource]
+    if isinstance(request_body, list):
+        return run_batch(model, request_body, request)
+    return run_operation(
+        partial(create_resource, model, request_body, request.method), request
+    )
+
+
+def run_operation(operation, request):
+    """Commit a replayable write operation and turn SQL errors into a 422.
+
+    A request with an Idempotency-Key the write was already applied for gets
+    the response stored for it instead, see the idempotency module.
+    """
+    try:
+        key = get_idempotency_key(request)
+    except ValueError as e:
+        return func.HttpResponse(
+            dumps({"message": f"Bad Request: {e}"}),
+            status_code=400,
+            mimetype="application/json",
+        )
+    fingerprint = None
+    if key is not None:
+        fingerprint = request_fingerprint(request)
+        response = replay_response(key, fingerprint, IDEMPOTENT_RESPONSES.get(key))
+        if response is not None:
+            return response
+    try:
+        response, stored_response = commit_operation(
+            partial(run_unit_of_work, operation, key, fingerprint)
+        )
+    except SQLAlchemyError as e:
+        session.rollback()
+        return func.HttpResponse(
+            dumps({"message": str(e)}), status_code=422, mimetype="application/json"
+        )
+    if stored_response is not None:
+        IDEMPOTENT_RESPONSES.add(key, stored_response)
+    return response
+
+
+def run_unit_of_work(operation, key, fingerprint):
+    """Run a write operation in a single transaction, committed once.
+
+    ``operation`` only flushes, it returns its response along with the
+    arguments moving the active meetings projection past the write, None when
+    the projection can't follow it. A successful response is stored under the
+    Idempotency-Key in the same transaction, a failed one changed nothing and
+    is rolled back. Return the response along with what to cache once the push
+    succeeded, if anything.
+    """
+    base_db_version = get_local_db_version()
+    create_tables()
+    if key is not None:
+        response = replay_response(key, fingerprint, find_stored_response(key))
+        if response is not None:
+            return response, None
+
+    response, projection_change = operation()
+    if not 200 <= response.status_code < 300:
+        session.rollback()
+        return response, None
+    stored_response = None
+    if key is not None:
+        stored_response = store_response(key, fingerprint, response)
+    session.commit()
+    if projection_change is None:
+        ACTIVE_MEETINGS.invalidate()
+    else:
+        ACTIVE_MEETINGS.apply(
+            base_db_version, get_local_db_version(), **projection_change
+        )
+    return response, stored_response
+
+
+def run_batch(model, items, request):
+    errors = validate_batch(model, items, request.method)
+    if errors:
+        return func.HttpResponse(
+            dumps({"message": "Bad request", "errors": errors}),
+            status_code=400,
+            mimetype="application/json",
+        )
+    return run_operation(partial(apply_batch, model, items, request.method), request)
+
+
+def validate_batch(model, items, request_method):
+    """Return what is wrong with a batch, nothing of it is applied if anything is."""
+    if not 0 < len(items) <= BATCH_MAX_ITEMS:
+        return [{"message": f"A batch holds 1 to {BATCH_MAX_ITEMS} items"}]
+
+    errors = []
+    for index, item in enumerate(items):
+        if request_method == "DELETE":
+            message = None if is_resource_id(item) else "Expected a resource id"
+        elif not isinstance(item, dict):
+            message = "Expected an object"
+        elif request_method == "PATCH" and not is_resource_id(item.get("id")):
+            message = "Expected a resource id in 'id'"
+        else:
+            message = validate_batch_fields(model, item, request_method)
+        if message:
+            errors.append({"index": index, "message": message})
+    return errors
+
+
+def validate_batch_fields(model, item, request_method):
+    name_field = "roomName" if model == Meeting else "name"
+    name = item.get(name_field)
+    if (request_method == "POST" or name_field in item) and not (
+        isinstance(name, str) and name
+    ):
+        return f"Expected a name in '{name_field}'"
+    if model != Meeting:
+        return None
+    if not isinstance(item.get("link", ""), str):
+        return "Expected a string in 'link'"
+    for field in ("participants", "labels"):
+        names = item.get(field, [])
+        if not isinstance(names, list) or not all(isinstance(n, str) for n in names):
+            return f"Expected a list of names in '{field}'"
+    return None
+
+
+def is_resource_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def apply_batch(model, items, request_method):
+    """Apply every item of a batch in a single transaction.
+
+    Each item runs in its own SAVEPOINT, an item failing on a constraint is
+    rolled back alone and reported in its result while the others are kept.
+    """
+    results = []
+    for item in items:
+        savepoint = session.begin_nested()
+        try:
+            result = apply_batch_item(model, item, request_method)
+            savepoint.commit()
+        except SQLAlchemyError as e:
+            savepoint.rollback()
+            result = {"status": 422, "message": str(e)}
+        results.append(result)
+    response = func.HttpResponse(
+        dumps({"results": results}), status_code=200, mimetype="application/json"
+    )
+    return response, None
+
+
+def apply_batch_item(model, item, request_method):
+    """Apply one item, its result mirrors what the single resource route returns."""
+    if request_method == "POST":
+        resource = create_item(model, item, request_method)
+        return {"status": 201, "body": serialize_resource(resource)}
+
+    resource_id = item["id"] if request_method == "PATCH" else item
+    resource = session.get(model, resource_id)
+    if resource is None:
+        return {"status": 404, "message": "Resource doesn't exist"}
+    if request_method == "PATCH":
+        resource = update_item(model, resource, item, request_method)
+        return {"status": 201, "body": serialize_resource(resource)}
+    delete_item(model, resource)
+    return {"status": 200, "message": "Successfully deleted the resource"}
+
+
+def create_resource(model, request_body, request_method):
+    resource = create_item(model, request_body, request_method)
+    body = serialize_resource(resource)
+    return format_return_body(body), {"meeting": body} if model == Meeting else {}
+
+
+def create_item(model, request_body, request_method):
+    if model == Meeting:
+        meeting = post_meeting(request_body, request_method)
+        update_search_index([meeting.id])
+        return meeting
+    elif model == Participant:
+        return post_participant(request_body)
+    elif model == Label:
+        return post_label(request_body)
+
+
+def post_meeting(request_body, request_method):
+    date_format = "%B %d, %Y - %I:%M %p"
+    current_time_str = datetime.now().strftime(date_format)
+    meeting_date = datetime.strptime(current_time_str, date_format)
+    room_name = request_body.get("roomName")
+
+    meeting = Meeting(room_name, meeting_date)
+    add_participants_and_labels_to_meeting(meeting, request_body, request_method)
+    meeting.insert()
+    update_meeting_stats(None, MeetingStats(meeting))
+    return meeting
+
+
+def add_participants_and_labels_to_meeting(meeting, request_body, request_method):
+    if request_method == "PATCH":
+        if request_body.get("participants"):
+            meeting.participants.clear()
+        if request_body.get("labels"):
+            meeting.labels.clear()
+
+    # Both are looked up before attaching anything, a new meeting joins the
+    # session along with its participants and labels.
+    participants = get_or_create_by_names(
+        Participant, request_body.get("participants", [])
+    )
+    labels = get_or_create_by_names(Label, request_body.get("labels", []))
+    attached_participants = set(meeting.participants)
+    meeting.participants.extend(
+        participant
+        for participant in participants
+        if participant not in attached_participants
+    )
+    attached_labels = set(meeting.labels)
+    meeting.labels.extend(label for label in labels if label not in attached_labels)
+
+
+def get_or_create_by_names(model, names):
+    """Return a ``model`` row per name, matching existing names case-insensitively.
+
+    Only the requested names are looked up, so the cost doesn't grow with the
+    table. The missing ones are inserted with a single statement returning
+    their primary keys, instead of looking them up again.
+    """
+    requested = {}
+    for name in names:
+        requested.setdefault(name.casefold(), name)
+    if not requested:
+        return []
+
+    instances = find_by_names(model, requested.values())
+    missing_names = [
+        name for folded_name, name in requested.items() if folded_name not in instances
+    ]
+    if missing_names:
+        if session.get_bind().dialect.insert_returning:
+            created = session.scalars(
+                insert(model).returning(model),
+                [{"name": name} for name in missing_names],
+            ).all()
+        else:
+            # SQLite before 3.35 has no RETURNING, the flush inserts the rows
+            # one at a time to read their rowid.
+            created = [model(name) for name in missing_names]
+            session.add_all(created)
+            session.flush()
+        instances.update((instance.name.casefold(), instance) for instance in created)
+    return [instances[folded_name] for folded_name in requested]
+
+
+def find_by_names(model, names):
+    # NOCASE only folds ASCII, like the unique index it is looked up in.
+    query = session.query(model).filter(model.name.collate("NOCASE").in_(names))
+    return {instance.name.casefold(): instance for instance in query}
+
+
+def post_participant(request_body):
+    participant = Participant(request_body.get("name"))
+    participant.insert()
+    return participant
+
+
+def post_label(request_body):
+    label = Label(request_body.get("name"))
+    label.insert()
+    return label
+
+
+def delete_dispatcher(request) -> Union[dict, None]:
+    DELETE_RESOURCES = ["meetings", "labels", "participants"]
+    resource = request.route_params.get("resources", None)
+    resource_id = request.route_params.get("id", None)
+    batch = None if resource_id else get_batch_body(request)
+    if resource not in DELETE_RESOURCES or not resource_id and batch is None:
+        return func.HttpResponse(
+            dumps({"message": "Bad request"}),
+            status_code=400,
+            mimetype="application/json",
+        )
+
+    model = RESOURCE_TO_MODEL_MAPPER[resource]
+    if batch is not None:
+        return run_batch(model, batch, request)
+    return run_operation(partial(delete_resource, model, resource_id), request)
+
+
+def get_batch_body(request):
+    """Return the items of a batch request body, None for anything else."""
+    try:
+        request_body = request.get_json()
+    except ValueError:
+        return None
+    return request_body if isinstance(request_body, list) else None
+
+
+def delete_resource(model, resource_id):
+    resource = session.get(model, resource_id)
+    if resource is None:
+        return resource_not_found_response(), None
+    delete_item(model, resource)
+    response = func.HttpResponse(
+        dumps({"message": "Successfully deleted the resource"}),
+        status_code=200,
+        mimetype="application/json",
+    )
+    return response, {"removed_id": int(resource_id)} if model == Meeting else None
+
+
+def resource_not_found_response():
+    return func.HttpResponse(
+        dumps({"message": "Resource doesn't exist"}),
+        status_code=404,
+        mimetype="application/json",
+    )
+
+
+def delete_item(model, resource):
+    meeting_ids = linked_meeting_ids(model, resource)
+    if model == Meeting:
+        update_meeting_stats(MeetingStats(resource), None)
+    else:
+        delete_stats(resource)
+    resource.delete()
+    update_search_index(meeting_ids)
+
+
+def linked_meeting_ids(model, resource):
+    """Return the ids of the meetings whose search row ``resource`` is part of."""
+    if model == Meeting:
+        return [resource.id]
+    association_table = (
+        participants_association_table
+        if model == Participant
+        else labels_association_table
+    )
+    foreign_key = association_table.c[f"{model.__tablename__}_id"]
+    return session.scalars(
+        select(association_table.c.meeting_id).where(foreign_key == resource.id)
+    ).all()
+
+
+def format_return_body(body):
+    return func.HttpResponse(
+        dumps(body),
+        status_code=201,
+        mimetype="application/json",
+    )
+
+
+def patch_dispatcher(request) -> Union[dict, None]:
+    PATCH_RESOURCES = ["meetings", "labels", "participants"]
+    resource = request.route_params.get("resources", None)
+    resource_id = request.route_params.get("id", None)
+    batch = None if resource_id else get_batch_body(request)
+    if resource not in PATCH_RESOURCES or not resource_id and batch is None:
+        return func.HttpResponse(
+            dumps({"message": "Bad request"}),
+            status_code=400,
+            mimetype="application/json",
+        )
+
+    model = RESOURCE_TO_MODEL_MAPPER[resource]
+    if batch is not None:
+        return run_batch(model, batch, request)
+    request_body = request.get_json()
+    return run_operation(
+        partial(update_resource, model, resource_id, request_body, request.method),
+        request,
+    )
+
+
+def update_resource(model, resource_id, request_body, request_method):
+    resource = session.get(model, resource_id)
+    if resource is None:
+        return resource_not_found_response(), None
+
+    resource = update_item(model, resource, request_body, request_method)
+    body = serialize_resource(resource)
+    return format_return_body(body), {"meeting": body} if model == Meeting else None
+
+
+def update_item(model, resource, request_body, request_method):
+    if model == Meeting:
+        resource = patch_meeting(resource, request_body, request_method)
+    elif model == Participant:
+        resource = patch_participant(resource, request_body)
+    elif model == Label:
+        resource = patch_label(resource, request_body)
+    update_search_index(linked_meeting_ids(model, resource))
+    return resource
+
+
+def patch_label(resource, request_body):
+    resource.name = request_body.get("name", resource.name)
+    resource.update()
+    return resource
+
+
+def patch_meeting(resource, request_body, request_method):
+    stats_before = MeetingStats(resource)
+    resource.name = request_body.get("roomName", resource.name)
+    resource.link = request_body.get("link", resource.link)
+
+    if request_body.get("endingFlag", None):
+        date_format = "%B %d, %Y - %I:%M %p"
+        current_time_str = datetime.now().strftime(date_format)
+        date_ended = datetime.strptime(current_time_str, date_format)
+        resource.date_ended = date_ended
+
+    add_participants_and_labels_to_meeting(resource, request_body, request_method)
+    resource.update()
+    update_meeting_stats(stats_before, MeetingStats(resource))
+    return resource
+
+
+def patch_participant(resource, request_body):
+    resource.name = request_body.get("name", resource.name)
+    resource.update()
+    return resource
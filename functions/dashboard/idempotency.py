@@ -0,0 +1,166 @@
+"""Responses of writes sent with an Idempotency-Key header.
+
+The Jitsi client retries writes that timed out, which may have been applied
+already. The response of a write is stored with its key in the write's
+transaction, pushed along with it so every instance sees it, and in an
+in-memory LRU once the push succeeded. A retry with the same key gets the
+stored response back: from the LRU without touching GitHub, or from the
+database without a mutation or a push of its own.
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from hashlib import sha256
+from json import dumps
+from os import getenv
+
+import azure.functions as func
+from sqlalchemy import delete, select
+
+from ..models import IdempotencyKey, session
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# Methods whose requests may carry an Idempotency-Key.
+IDEMPOTENT_METHODS = {"POST", "PATCH"}
+# Keys are forgotten after this many hours.
+IDEMPOTENCY_KEY_TTL = float(getenv("IDEMPOTENCY_KEY_TTL", 24))
+IDEMPOTENCY_CACHE_SIZE = int(getenv("IDEMPOTENCY_CACHE_SIZE", 1000))
+
+
+class StoredResponse:
+    def __init__(self, fingerprint, status_code, mimetype, body, created_at):
+        self.fingerprint = fingerprint
+        self.status_code = status_code
+        self.mimetype = mimetype
+        self.body = body
+        self.created_at = created_at
+
+    def is_expired(self):
+        return self.created_at < datetime.now() - timedelta(hours=IDEMPOTENCY_KEY_TTL)
+
+    def to_response(self):
+        return func.HttpResponse(
+            self.body,
+            status_code=self.status_code,
+            headers={"Idempotent-Replayed": "true"},
+            mimetype=self.mimetype,
+        )
+
+
+class IdempotentResponseCache:
+    """The stored responses of the most recently pushed keys."""
+
+    def __init__(self, size):
+        self._lock = threading.Lock()
+        self._size = size
+        self._responses = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            stored_response = self._responses.get(key)
+            if stored_response is not None:
+                self._responses.move_to_end(key)
+            return stored_response
+
+    def add(self, key, stored_response):
+        with self._lock:
+            self._responses[key] = stored_response
+            self._responses.move_to_end(key)
+            while len(self._responses) > self._size:
+                self._responses.popitem(last=False)
+
+
+IDEMPOTENT_RESPONSES = IdempotentResponseCache(IDEMPOTENCY_CACHE_SIZE)
+
+
+def get_idempotency_key(request):
+    """Return the request's Idempotency-Key, None when it doesn't take one.
+
+    Raises a ValueError for a key that can't be stored.
+    """
+    if request.method not in IDEMPOTENT_METHODS:
+        return None
+    key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+    if key is not None and not 0 < len(key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise ValueError(
+            f"{IDEMPOTENCY_KEY_HEADER} must have 1 to"
+            f" {IDEMPOTENCY_KEY_MAX_LENGTH} characters"
+        )
+    return key
+
+
+def request_fingerprint(request):
+    """Hash what a write asks for, a key is only replayed for the same request."""
+    route = "/".join(
+        request.route_params.get(param) or "" for param in ("resources", "id")
+    )
+    return sha256(
+        f"{request.method} {route}\n".encode() + request.get_body()
+    ).hexdigest()
+
+
+def replay_response(key, fingerprint, stored_response):
+    """Return the response to a request reusing ``key``, None if it isn't stored."""
+    if stored_response is None or stored_response.is_expired():
+        return None
+    if stored_response.fingerprint != fingerprint:
+        return func.HttpResponse(
+            dumps(
+                {
+                    "message": f"{IDEMPOTENCY_KEY_HEADER} {key} was used"
+                    " for a different request"
+                }
+            ),
+            status_code=422,
+            mimetype="application/json",
+        )
+    return stored_response.to_response()
+
+
+def find_stored_response(key):
+    row = session.execute(
+        select(IdempotencyKey).where(IdempotencyKey.key == key)
+    ).scalar_one_or_none()
+    if row is None:
+        return None
+    return StoredResponse(
+        row.fingerprint, row.status_code, row.mimetype, row.body, row.created_at
+    )
+
+
+def store_response(key, fingerprint, response):
+    """Store a write's ``response`` under ``key`` in the write's transaction.
+
+    It is pushed along with the write, so a replay finds a key written by
+    another instance in the database it was cloned from. Return what to cache
+    once the push succeeded.
+    """
+    stored_response = StoredResponse(
+        fingerprint,
+        response.status_code,
+        response.mimetype,
+        response.get_body().decode(),
+        datetime.now(),
+    )
+    session.execute(
+        delete(IdempotencyKey).where(
+            (IdempotencyKey.key == key)
+            | (
+                IdempotencyKey.created_at
+                < datetime.now() - timedelta(hours=IDEMPOTENCY_KEY_TTL)
+            )
+        )
+    )
+    session.add(
+        IdempotencyKey(
+            key=key,
+            fingerprint=stored_response.fingerprint,
+            status_code=stored_response.status_code,
+            mimetype=stored_response.mimetype,
+            body=stored_response.body,
+            created_at=stored_response.created_at,
+        )
+    )
+    return stored_response
@@ -0,0 +1,67 @@
+import threading
+from json import dumps
+
+from ..timing import timed
+
+
+class ActiveMeetingsProjection:
+    """Serialized active meetings of one version of the local database.
+
+    The projection is rebuilt from SQLite when the local database changed
+    behind its back (a newer copy was cloned, a write failed halfway) and is
+    patched in place by the instance's own writes, so GET requests on a warm
+    instance reuse the same response body.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self._meetings = {}
+        self._body = None
+
+    def is_current(self, version):
+        return version is not None and self.version == version
+
+    def rebuild(self, version, meetings):
+        with self._lock:
+            self.version = version
+            self._meetings = {meeting["id"]: dumps(meeting) for meeting in meetings}
+            self._body = None
+
+    def apply(self, base_version, version, meeting=None, removed_id=None):
+        """Move the projection from ``base_version`` to ``version``.
+
+        ``meeting`` is the serialized meeting a write created or changed, it is
+        dropped once it has ended, ``removed_id`` is a deleted one. When the
+        projection wasn't built from ``base_version`` it misses other changes,
+        so it is left for the next reader to rebuild.
+        """
+        with self._lock:
+            if not self.is_current(base_version):
+                return
+            if meeting is not None and not meeting["date_ended"]:
+                self._meetings[meeting["id"]] = dumps(meeting)
+            elif meeting is not None:
+                self._meetings.pop(meeting["id"], None)
+            elif removed_id is not None:
+                self._meetings.pop(removed_id, None)
+            self.version = version
+            self._body = None
+
+    def invalidate(self):
+        with self._lock:
+            self.version = None
+
+    @timed("serialize")
+    def body(self):
+        """Return the ``activeMeetings`` JSON, None when no meeting is active."""
+        with self._lock:
+            if self._body is None and self._meetings:
+                meetings = ", ".join(
+                    self._meetings[meeting_id] for meeting_id in sorted(self._meetings)
+                )
+                self._body = f'{{"activeMeetings": [{meetings}]}}'
+            return self._body
+
+
+ACTIVE_MEETINGS = ActiveMeetingsProjection()
@@ -1,28 +1,705 @@
-from os import environ
-from github import Github
+import threading
+from functools import lru_cache
+from io import BytesIO
+from os import environ, getenv
+from random import uniform
+from time import monotonic, sleep
+from github import Github, GithubException, InputGitTreeElement
 from datetime import datetime
-from ..models import database_location
-
+from requests import Session
+from ..models import (
+    database_location,
+    db_file_lock,
+    dump_local_db,
+    get_local_db_version,
+    local_db_download,
+    open_local_db,
+    patch_local_db,
+    session,
+)
+from ..timing import count, gauge, timed
+from .budget import DEGRADED, EXHAUSTED, RateLimitBudget, RateLimitExhausted
+from .chunks import (
+    CONFIG_FILE_NAME,
+    ChunkEntry,
+    ChunkedDbMetadata,
+    build_config,
+    chunk_index,
+    git_blob_sha,
+    split_into_chunks,
+)
+from .transfer import download_blob, upload_blob
 
 TARGET_BRANCH = "gh-pages"
 REPO_FULL_NAME = "ElGarash/meetings"
-REPO = Github(environ["GITHUB_ACCESS_TOKEN"]).get_repo(REPO_FULL_NAME)
+DB_FILE_PATH = "database.db"
+# "file" pushes database.db as a whole, "chunked" publishes it in
+# sql.js-httpvfs chunked server mode under DB_CHUNKS_DIR and only commits
+# the chunks a write changed.
+DB_PUBLISH_MODE = getenv("DB_PUBLISH_MODE", "file")
+DB_CHUNKS_DIR = getenv("DB_CHUNKS_DIR", "db")
+DB_CHUNK_SIZE = int(getenv("DB_CHUNK_SIZE", 64 * 1024))
+# Rewrite the database for sql.js-httpvfs (page size, VACUUM, ANALYZE and
+# the dashboard's covering indexes) before each push.
+DB_OPTIMIZE_FOR_HTTPVFS = getenv("DB_OPTIMIZE_FOR_HTTPVFS", "false") == "true"
+DB_HTTPVFS_PAGE_SIZE = int(getenv("DB_HTTPVFS_PAGE_SIZE", 1024))
+# Seconds a write waits for other writes on this instance to share its push.
+PUSH_COALESCE_WINDOW = float(getenv("PUSH_COALESCE_WINDOW", 0.5))
+# Pushes rejected because another instance pushed first are retried with
+# exponential backoff and full jitter.
+PUSH_MAX_ATTEMPTS = int(getenv("PUSH_MAX_ATTEMPTS", 5))
+PUSH_RETRY_BASE_DELAY = float(getenv("PUSH_RETRY_BASE_DELAY", 0.25))
+PUSH_RETRY_MAX_DELAY = float(getenv("PUSH_RETRY_MAX_DELAY", 4))
+# Another GitHub API to talk to, like the local fake the benchmarks run on.
+GITHUB_API_URL = getenv("GITHUB_API_URL", "https://api.github.com")
+# Blobs are streamed this many bytes at a time, downloads are gzipped on the
+# wire unless DB_TRANSFER_COMPRESSION is "false".
+DB_TRANSFER_CHUNK_SIZE = int(getenv("DB_TRANSFER_CHUNK_SIZE", 1024 * 1024))
+DB_TRANSFER_COMPRESSION = getenv("DB_TRANSFER_COMPRESSION", "true") == "true"
+DB_TRANSFER_TIMEOUT = float(getenv("DB_TRANSFER_TIMEOUT", 60))
+# Databases up to this size are pushed with the contents API, bigger ones,
+# or pushes with other files, are streamed and committed with the Git Data
+# API. A push that doesn't start from what gh-pages holds fails as a
+# conflict either way.
+CONTENTS_API_MAX_SIZE = int(getenv("CONTENTS_API_MAX_SIZE", 1024 * 1024))
+# Once less than this fraction of the token's hourly GitHub API requests is
+# left, writes wait DEGRADED_PUSH_COALESCE_WINDOW seconds to share a push and
+# reads use a local copy up to DEGRADED_READ_MAX_AGE seconds old. With fewer
+# than GITHUB_BUDGET_WRITE_RESERVE requests left, writes are refused until
+# the limit resets and reads only use the local copy.
+GITHUB_BUDGET_DEGRADED_FRACTION = float(getenv("GITHUB_BUDGET_DEGRADED_FRACTION", 0.2))
+GITHUB_BUDGET_WRITE_RESERVE = int(getenv("GITHUB_BUDGET_WRITE_RESERVE", 10))
+DEGRADED_PUSH_COALESCE_WINDOW = float(getenv("DEGRADED_PUSH_COALESCE_WINDOW", 5))
+DEGRADED_READ_MAX_AGE = float(getenv("DEGRADED_READ_MAX_AGE", 60))
+
+rate_limit = RateLimitBudget(
+    GITHUB_BUDGET_DEGRADED_FRACTION, GITHUB_BUDGET_WRITE_RESERVE
+)
+
+
+@lru_cache(maxsize=None)
+def get_github():
+    return Github(environ["GITHUB_ACCESS_TOKEN"], base_url=GITHUB_API_URL)
+
+
+@lru_cache(maxsize=None)
+def get_repo():
+    """Build the repository handle on first use instead of at import time."""
+    return get_github().get_repo(REPO_FULL_NAME)
+
+
+@lru_cache(maxsize=None)
+def get_http_session():
+    """Session streaming blobs, PyGithub only handles them whole."""
+    http = Session()
+    http.headers.update(
+        {
+            "Authorization": f"token {environ['GITHUB_ACCESS_TOKEN']}",
+            "User-Agent": "Jitsi-Meetings-Dashboard",
+        }
+    )
+    http.hooks["response"].append(observe_rate_limit)
+    return http
+
+
+def observe_rate_limit(response, *args, **kwargs):
+    rate_limit.observe_headers(response.headers)
+    if rate_limit.remaining is not None:
+        gauge("github_remaining", rate_limit.remaining)
+
+
+def get_rate_limit_mode():
+    """Return the mode of the GitHub API budget, see the budget module.
+
+    PyGithub keeps the rate limit of the last response it got, the blob
+    session reports its own as they come.
+    """
+    requester = get_github().requester
+    remaining, limit = requester.rate_limiting
+    if limit >= 0:
+        rate_limit.observe(remaining, limit, requester.rate_limiting_resettime)
+    if rate_limit.remaining is not None:
+        gauge("github_remaining", rate_limit.remaining)
+    return rate_limit.mode()
+
+
+def get_blobs_url():
+    return f"{GITHUB_API_URL}/repos/{REPO_FULL_NAME}/git/blobs"
+
+
+# State of the local copy kept by a warm instance between invocations.
+_branch_ref = None
+_local_commit_sha = None
+_local_db_file_metadata = None
+_local_db_version = None
+_last_synced_at = None
+
+# Writes on this instance are grouped in batches pushed as a single commit.
+# While a batch is open or being pushed the local copy holds unpushed changes
+# and must not be replaced by the remote one.
+_batch_condition = threading.Condition()
+# Operations run one at a time so their changes land in a single order.
+_operation_lock = threading.Lock()
+_open_batch = None
+_flushing_batch = None
+# The batch of the operation running, which files are staged in.
+_staging_batch = None
+
+
+class WriteBatch:
+    def __init__(self, db_file_metadata, coalesce_window):
+        self.db_file_metadata = db_file_metadata
+        self.deadline = monotonic() + coalesce_window
+        self.active_writers = 0
+        self.operations = []
+        # Paths to commit along with the database, to their content or None
+        # to delete them.
+        self.files = {}
+        self.done = False
+        self.error = None
+
+
+class DbFileMetadata:
+    """What a local copy was cloned from when database.db is published whole."""
+
+    def __init__(self, commit_sha, path, sha, size):
+        self.commit_sha = commit_sha
+        self.path = path
+        self.sha = sha
+        self.size = size
+
+
+class BatchedOperation:
+    def __init__(self, operation, result):
+        self.operation = operation
+        self.result = result
+        self.error = None
+
+
+def commit_operation(operation):
+    """Apply ``operation`` to the local database and push it with its batch.
+
+    ``operation`` is a callable holding everything needed to redo the
+    mutation, it must not rely on ORM objects loaded before it runs. When the
+    push conflicts with a write from another instance, the database is cloned
+    again and every operation of the batch is replayed on it before retrying,
+    so the value returned is the one of the operation's last run.
+
+    The caller waits until the batch it joined is pushed and gets the push
+    error, if any, so every writer of a batch succeeds or fails together. An
+    operation that raises on its first run leaves the batch right away.
+
+    Raises RateLimitExhausted without running ``operation`` when the GitHub
+    API budget can't afford a push.
+    """
+    global _open_batch
+    rate_limit_mode = get_rate_limit_mode()
+    if rate_limit_mode == EXHAUSTED:
+        raise RateLimitExhausted(rate_limit.reset_at)
+    with _batch_condition:
+        while _flushing_batch is not None or (
+            _open_batch is not None and _open_batch.deadline <= monotonic()
+        ):
+            _batch_condition.wait()
+        if _open_batch is None:
+            _open_batch = WriteBatch(
+                sync_local_db_file(),
+                (
+                    DEGRADED_PUSH_COALESCE_WINDOW
+                    if rate_limit_mode == DEGRADED
+                    else PUSH_COALESCE_WINDOW
+                ),
+            )
+        batch = _open_batch
+        batch.active_writers += 1
+
+    try:
+        with _operation_lock:
+            batched_operation = BatchedOperation(
+                operation, run_batched(batch, operation)
+            )
+            # The database may be replaced while waiting for the push, which
+            # the session's connection would hold off.
+            session.close()
+    except BaseException:
+        with _batch_condition:
+            batch.active_writers -= 1
+            if batch.active_writers == 0 and not batch.operations:
+                # Nobody is left to push the batch, drop it.
+                _open_batch = None
+            _batch_condition.notify_all()
+        raise
+    with _batch_condition:
+        batch.active_writers -= 1
+        batch.operations.append(batched_operation)
+        _batch_condition.notify_all()
+
+    wait_for_batch(batch)
+    if batched_operation.error:
+        raise batched_operation.error
+    return batched_operation.result
+
+
+def run_batched(batch, operation):
+    """Run ``operation`` for ``batch``, dropping the files it staged if it raises."""
+    global _staging_batch
+    files = dict(batch.files)
+    _staging_batch = batch
+    try:
+        return operation()
+    except BaseException:
+        batch.files = files
+        raise
+    finally:
+        _staging_batch = None
+
+
+def stage_file(path, content):
+    """Commit ``path`` along with the database, ``content`` None deletes it.
+
+    Only operations run by commit_operation can stage files, they are
+    replayed along with the operation.
+    """
+    _staging_batch.files[path] = content
+
+
+def read_batch_file(path):
+    """Return the content ``path`` is going to be pushed with, None if missing."""
+    batch = _staging_batch
+    if path in batch.files:
+        return batch.files[path]
+    return read_remote_file(batch.db_file_metadata.commit_sha, path)
+
+
+def wait_for_batch(batch):
+    global _open_batch, _flushing_batch
+    with _batch_condition:
+        while not batch.done:
+            if batch is _open_batch and batch.active_writers == 0:
+                remaining = batch.deadline - monotonic()
+                if remaining <= 0:
+                    _open_batch, _flushing_batch = None, batch
+                    break
+                _batch_condition.wait(remaining)
+            else:
+                _batch_condition.wait()
+        else:
+            if batch.error:
+                raise batch.error
+            return
+
+    # This writer pushes the batch on behalf of everyone who joined it.
+    try:
+        push_batch(batch)
+    except Exception as e:
+        batch.error = e
+    finally:
+        with _batch_condition:
+            batch.done = True
+            _flushing_batch = None
+            _batch_condition.notify_all()
+    if batch.error:
+        raise batch.error
+
+
+def push_batch(batch):
+    for attempt in range(PUSH_MAX_ATTEMPTS):
+        if get_local_db_version() == _local_db_version and not batch.files:
+            return
+        try:
+            push_db_file(batch.db_file_metadata, batch.files)
+            # Reports the budget left after PyGithub's calls.
+            get_rate_limit_mode()
+            return
+        except GithubException as e:
+            if not is_push_conflict(e) or attempt == PUSH_MAX_ATTEMPTS - 1:
+                raise
+        # Another instance pushed first: back off, then replay the batch on
+        # top of its version of the database.
+        count("push_retries")
+        delay = min(PUSH_RETRY_MAX_DELAY, PUSH_RETRY_BASE_DELAY * 2 ** attempt)
+        sleep(uniform(0, delay))
+        session.close()
+        batch.db_file_metadata = sync_local_db_file()
+        batch.files = {}
+        for batched_operation in batch.operations:
+            try:
+                batched_operation.result = run_batched(
+                    batch, batched_operation.operation
+                )
+                batched_operation.error = None
+            except Exception as e:
+                session.rollback()
+                batched_operation.error = e
+        session.close()
+
+
+def is_push_conflict(error):
+    # update_file answers 409 on a stale blob SHA, a ref update that isn't a
+    # fast forward is rejected with a 422.
+    if error.status == 409:
+        return True
+    return error.status == 422 and "fast forward" in str(error.data).lower()
 
 
-def clone_db_file():
-    db_file_metadata = REPO.get_contents("database.db", ref=TARGET_BRANCH)
-    with open(database_location, "wb") as db_file:
-        db_file.write(db_file_metadata.decoded_content)
+def clone_db_file(max_age=0):
+    """Return the metadata of the local database, refreshing it if possible.
+
+    Readers that can live with data up to ``max_age`` seconds old skip
+    checking GitHub when the local copy was synced more recently than that.
+    While the GitHub API budget runs low they live with older data, and once
+    it is exhausted with whatever local copy there is, RateLimitExhausted is
+    raised when there is none.
+    """
+    rate_limit_mode = get_rate_limit_mode()
+    if rate_limit_mode == DEGRADED:
+        max_age = max(max_age, DEGRADED_READ_MAX_AGE)
+    elif rate_limit_mode == EXHAUSTED:
+        if _last_synced_at is None or get_local_db_version() is None:
+            raise RateLimitExhausted(rate_limit.reset_at)
+        max_age = float("inf")
+    with _batch_condition:
+        if _open_batch is not None or _flushing_batch is not None:
+            return _local_db_file_metadata
+        if (
+            _last_synced_at is not None
+            and monotonic() - _last_synced_at < max_age
+            and get_local_db_version() is not None
+        ):
+            return _local_db_file_metadata
+        return sync_local_db_file()
+
+
+@timed("clone")
+def sync_local_db_file():
+    """Make the local database match gh-pages.
+
+    The branch ref is checked with a conditional request, so while nothing was
+    pushed GitHub answers with a 304 and the local copy is used as is. When the
+    branch moved (including by our own push), the database blob is only
+    downloaded if its SHA differs from the local copy's.
+    """
+    global _branch_ref, _local_commit_sha, _local_db_file_metadata, _local_db_version
+    global _last_synced_at
+    if _branch_ref is None:
+        _branch_ref = get_repo().get_git_ref(f"heads/{TARGET_BRANCH}")
+    else:
+        _branch_ref.update()
+    _last_synced_at = monotonic()
+
+    # A write that wasn't pushed (failed request, failed push) leaves the
+    # local file different from the blob it was cloned from.
+    local_db_version = get_local_db_version()
+    local_copy_is_clean = (
+        local_db_version is not None and local_db_version == _local_db_version
+    )
+    if local_copy_is_clean and _local_commit_sha == _branch_ref.object.sha:
+        return _local_db_file_metadata
+
+    if DB_PUBLISH_MODE == "chunked":
+        db_file_metadata = sync_local_db_chunks(
+            _branch_ref.object.sha, local_copy_is_clean
+        )
+    else:
+        db_file_metadata = get_remote_db_file_metadata(_branch_ref.object.sha)
+        if (
+            not local_copy_is_clean
+            or _local_db_file_metadata is None
+            or _local_db_file_metadata.sha != db_file_metadata.sha
+        ):
+            download_db_blob(db_file_metadata)
+
+    _local_commit_sha = _branch_ref.object.sha
+    _local_db_file_metadata = db_file_metadata
+    _local_db_version = get_local_db_version()
+    # Reports the budget left after PyGithub's calls.
+    get_rate_limit_mode()
     return db_file_metadata
 
 
-def push_db_file(db_file_metadata):
-    with open(database_location, "rb") as db_file:
-        updated_content = db_file.read()
-    REPO.update_file(
+def download_db_blob(db_file_metadata):
+    with local_db_download() as download:
+        download_blob(
+            get_http_session(),
+            get_blobs_url(),
+            db_file_metadata.sha,
+            db_file_metadata.size,
+            download,
+            DB_TRANSFER_CHUNK_SIZE,
+            DB_TRANSFER_COMPRESSION,
+            DB_TRANSFER_TIMEOUT,
+        )
+    count("github_bytes_in", db_file_metadata.size)
+
+
+def sync_local_db_chunks(commit_sha, local_copy_is_clean):
+    """Reassemble the local database from the chunks of ``commit_sha``.
+
+    Chunks are content addressed, so only the ones whose SHA differs from the
+    local copy's chunk at the same offset are downloaded and written in place.
+    Before anything was published in chunked mode, database.db is
+    downloaded instead and the first push uploads every chunk.
+    """
+    root_tree = get_repo().get_git_tree(commit_sha).tree
+    chunks_dir = next(
+        (element for element in root_tree if element.path == DB_CHUNKS_DIR), None
+    )
+    if chunks_dir is None:
+        download_db_blob(get_remote_db_file_metadata(commit_sha))
+        return ChunkedDbMetadata(commit_sha, None, [], None)
+
+    previous = _local_db_file_metadata
+    if local_copy_is_clean and isinstance(previous, ChunkedDbMetadata):
+        if previous.tree_sha == chunks_dir.sha:
+            return ChunkedDbMetadata(
+                commit_sha, chunks_dir.sha, previous.chunks, previous.config_sha
+            )
+        local_chunks = previous.chunks
+    elif get_local_db_version() is not None:
+        # Unpushed writes only touched some chunks, keep the others.
+        local_content = dump_local_db()
+        local_chunks = [
+            chunk for chunk, _ in split_into_chunks(local_content, DB_CHUNK_SIZE)
+        ]
+    else:
+        local_chunks = []
+
+    chunks, config_sha = [], None
+    for element in get_repo().get_git_tree(chunks_dir.sha).tree:
+        if element.path == CONFIG_FILE_NAME:
+            config_sha = element.sha
+        elif chunk_index(element.path) is not None:
+            chunks.append(ChunkEntry(element.path, element.sha, element.size))
+    chunks.sort(key=lambda chunk: chunk_index(chunk.path))
+
+    unchanged_chunks = set()
+    offset = 0
+    for chunk in local_chunks:
+        unchanged_chunks.add((chunk.sha, offset))
+        offset += chunk.size
+
+    changed_chunks = []
+    offset = 0
+    for chunk in chunks:
+        if (chunk.sha, offset) not in unchanged_chunks:
+            content = BytesIO()
+            download_blob(
+                get_http_session(),
+                get_blobs_url(),
+                chunk.sha,
+                chunk.size,
+                content,
+                DB_TRANSFER_CHUNK_SIZE,
+                DB_TRANSFER_COMPRESSION,
+                DB_TRANSFER_TIMEOUT,
+            )
+            count("github_bytes_in", chunk.size)
+            changed_chunks.append((offset, content.getvalue()))
+        offset += chunk.size
+    # Downloaded first so readers are only held off while the file is written.
+    patch_local_db(changed_chunks, offset)
+    return ChunkedDbMetadata(commit_sha, chunks_dir.sha, chunks, config_sha)
+
+
+def read_remote_file(commit_sha, path):
+    """Return the content of ``path`` in ``commit_sha``, None if it doesn't exist."""
+    *directories, name = path.split("/")
+    tree_sha = commit_sha
+    for directory in directories:
+        tree_sha = next(
+            (
+                element.sha
+                for element in get_repo().get_git_tree(tree_sha).tree
+                if element.path == directory and element.type == "tree"
+            ),
+            None,
+        )
+        if tree_sha is None:
+            return None
+    element = next(
+        (
+            element
+            for element in get_repo().get_git_tree(tree_sha).tree
+            if element.path == name and element.type == "blob"
+        ),
+        None,
+    )
+    if element is None:
+        return None
+    content = BytesIO()
+    download_blob(
+        get_http_session(),
+        get_blobs_url(),
+        element.sha,
+        element.size,
+        content,
+        DB_TRANSFER_CHUNK_SIZE,
+        DB_TRANSFER_COMPRESSION,
+        DB_TRANSFER_TIMEOUT,
+    )
+    count("github_bytes_in", element.size)
+    return content.getvalue()
+
+
+def get_remote_db_file_metadata(commit_sha):
+    for element in get_repo().get_git_tree(commit_sha).tree:
+        if element.path == DB_FILE_PATH:
+            return DbFileMetadata(commit_sha, element.path, element.sha, element.size)
+    raise FileNotFoundError(f"{DB_FILE_PATH} doesn't exist on {TARGET_BRANCH}")
+
+
+@timed("push")
+def push_db_file(db_file_metadata, files=None):
+    global _local_commit_sha, _local_db_file_metadata, _local_db_version
+    if DB_OPTIMIZE_FOR_HTTPVFS:
+        from .httpvfs import optimize
+
+        # Only done with the file storage, VACUUM needs the session to let go
+        # of the database.
+        session.close()
+        with db_file_lock.writing():
+            optimize(database_location, DB_HTTPVFS_PAGE_SIZE)
+    if DB_PUBLISH_MODE == "chunked":
+        push_db_chunks(db_file_metadata, dump_local_db(), files)
+        return
+
+    repo = get_repo()
+    with open_local_db() as db_file:
+        size = db_file.seek(0, 2)
+        db_file.seek(0)
+        if size <= CONTENTS_API_MAX_SIZE and not files:
+            push_db_file_contents(db_file_metadata, db_file.read())
+            return
+        blob_sha = upload_blob(
+            get_http_session(),
+            get_blobs_url(),
+            db_file,
+            size,
+            DB_TRANSFER_CHUNK_SIZE,
+            DB_TRANSFER_TIMEOUT,
+        )
+    count("github_bytes_out", size)
+    parent = repo.get_git_commit(db_file_metadata.commit_sha)
+    tree = repo.create_git_tree(
+        [InputGitTreeElement(db_file_metadata.path, "100644", "blob", sha=blob_sha)]
+        + upload_files(files),
+        base_tree=parent.tree,
+    )
+    commit = repo.create_git_commit(get_commit_message(), tree, [parent])
+    _branch_ref.edit(commit.sha)
+
+    # The local file is now what gh-pages holds, remember it so the next
+    # clone doesn't download it again.
+    _local_commit_sha = commit.sha
+    _local_db_file_metadata = DbFileMetadata(
+        commit.sha, db_file_metadata.path, blob_sha, size
+    )
+    _local_db_version = get_local_db_version()
+
+
+def push_db_file_contents(db_file_metadata, content):
+    """Commit a small database with the contents API, a single write.
+
+    PyGithub spaces its writes a second apart, so this saves the two seconds
+    the three writes of a Git Data API commit wait, and a third of their
+    requests. GitHub answers 409 when the file's SHA moved.
+    """
+    global _local_commit_sha, _local_db_file_metadata, _local_db_version
+    count("github_bytes_out", len(content))
+    pushed = get_repo().update_file(
         path=db_file_metadata.path,
-        message=f"Azure at {datetime.now().strftime('%B %d, %Y - %I:%M %p')}",
-        content=updated_content,
+        message=get_commit_message(),
+        content=content,
         sha=db_file_metadata.sha,
         branch=TARGET_BRANCH,
     )
+    _local_commit_sha = pushed["commit"].sha
+    _local_db_file_metadata = DbFileMetadata(
+        pushed["commit"].sha, db_file_metadata.path, pushed["content"].sha, len(content)
+    )
+    _local_db_version = get_local_db_version()
+
+
+def push_db_chunks(db_file_metadata, updated_content, files=None):
+    """Commit the chunks that differ from ``db_file_metadata`` in one commit.
+
+    The commit is built with the Git Data API on top of the commit the local
+    copy was cloned from, and the branch is only fast-forwarded to it, so a
+    concurrent push makes this one fail as a conflict.
+    """
+    global _local_commit_sha, _local_db_file_metadata, _local_db_version
+    repo = get_repo()
+    remote_chunks = {chunk.path: chunk.sha for chunk in db_file_metadata.chunks}
+    chunks = split_into_chunks(updated_content, DB_CHUNK_SIZE)
+
+    tree_elements = []
+    for chunk, content in chunks:
+        if remote_chunks.pop(chunk.path, None) != chunk.sha:
+            blob_sha = upload_blob(
+                get_http_session(),
+                get_blobs_url(),
+                BytesIO(content),
+                len(content),
+                DB_TRANSFER_CHUNK_SIZE,
+                DB_TRANSFER_TIMEOUT,
+            )
+            count("github_bytes_out", len(content))
+            tree_elements.append(chunk_tree_element(chunk.path, blob_sha))
+    for removed_chunk_path in remote_chunks:
+        tree_elements.append(chunk_tree_element(removed_chunk_path, None))
+    config = build_config(
+        updated_content, DB_CHUNK_SIZE, [chunk for chunk, _ in chunks]
+    )
+    config_sha = git_blob_sha(config)
+    if config_sha != db_file_metadata.config_sha:
+        tree_elements.append(
+            InputGitTreeElement(
+                f"{DB_CHUNKS_DIR}/{CONFIG_FILE_NAME}",
+                "100644",
+                "blob",
+                content=config.decode(),
+            )
+        )
+    tree_elements.extend(upload_files(files))
+    if not tree_elements:
+        return
+
+    parent = repo.get_git_commit(db_file_metadata.commit_sha)
+    tree = repo.create_git_tree(tree_elements, base_tree=parent.tree)
+    commit = repo.create_git_commit(get_commit_message(), tree, [parent])
+    _branch_ref.edit(commit.sha)
+
+    chunks_dir = next(element for element in tree.tree if element.path == DB_CHUNKS_DIR)
+    _local_commit_sha = commit.sha
+    _local_db_file_metadata = ChunkedDbMetadata(
+        commit.sha, chunks_dir.sha, [chunk for chunk, _ in chunks], config_sha
+    )
+    _local_db_version = get_local_db_version()
+
+
+def upload_files(files):
+    """Return the tree elements committing staged ``files``."""
+    tree_elements = []
+    for path, content in (files or {}).items():
+        blob_sha = None
+        if content is not None:
+            blob_sha = upload_blob(
+                get_http_session(),
+                get_blobs_url(),
+                BytesIO(content),
+                len(content),
+                DB_TRANSFER_CHUNK_SIZE,
+                DB_TRANSFER_TIMEOUT,
+            )
+            count("github_bytes_out", len(content))
+        tree_elements.append(InputGitTreeElement(path, "100644", "blob", sha=blob_sha))
+    return tree_elements
+
+
+def chunk_tree_element(path, sha):
+    # A None SHA removes the file from the tree.
+    return InputGitTreeElement(f"{DB_CHUNKS_DIR}/{path}", "100644", "blob", sha=sha)
+
+
+def get_commit_message():
+    return f"Azure at {datetime.now().strftime('%B %d, %Y - %I:%M %p')}"
@@ -0,0 +1,91 @@
+"""The GitHub API rate limit every call made with the token draws from.
+
+GitHub sends how many requests are left until the hourly window resets with
+every response, whether it went through PyGithub or the blob session. The
+budget follows the lowest count seen in the newest window, and its mode
+tells callers how careful to be:
+
+- "normal" while more than a fraction of the limit is left,
+- "degraded" below it, where writes wait longer to share a push and reads
+  are served from the local copy for longer,
+- "exhausted" once a push doesn't fit anymore, until the window resets.
+
+A window that has reset, or a budget never reported, counts as normal.
+"""
+
+import logging
+import threading
+from time import time
+
+NORMAL = "normal"
+DEGRADED = "degraded"
+EXHAUSTED = "exhausted"
+
+
+class RateLimitExhausted(Exception):
+    def __init__(self, reset_at):
+        super().__init__("The GitHub API rate limit is exhausted")
+        self.reset_at = reset_at
+
+    def retry_after(self):
+        """Seconds until the rate limit resets."""
+        return max(1, int(self.reset_at - time()) + 1)
+
+
+class RateLimitBudget:
+    def __init__(self, degraded_fraction, exhausted_below):
+        self.degraded_fraction = degraded_fraction
+        self.exhausted_below = exhausted_below
+        self._lock = threading.Lock()
+        self.remaining = None
+        self.limit = None
+        self.reset_at = None
+        self._mode = NORMAL
+
+    def observe(self, remaining, limit, reset_at):
+        """Record the rate limit a response reported.
+
+        Responses may arrive out of order, within a window the count only
+        goes down and reports from an older window are dropped.
+        """
+        with self._lock:
+            if self.reset_at is None or reset_at > self.reset_at:
+                self.remaining, self.limit, self.reset_at = remaining, limit, reset_at
+            elif reset_at == self.reset_at:
+                self.remaining = min(self.remaining, remaining)
+            self._update_mode()
+
+    def observe_headers(self, headers):
+        try:
+            self.observe(
+                int(headers["X-RateLimit-Remaining"]),
+                int(headers["X-RateLimit-Limit"]),
+                int(headers["X-RateLimit-Reset"]),
+            )
+        except (KeyError, ValueError):
+            # GitHub Enterprise Server leaves it out when rate limiting is off.
+            pass
+
+    def mode(self):
+        with self._lock:
+            return self._update_mode()
+
+    def _update_mode(self):
+        if self.reset_at is None or time() >= self.reset_at:
+            mode = NORMAL
+        elif self.remaining < self.exhausted_below:
+            mode = EXHAUSTED
+        elif self.remaining < self.limit * self.degraded_fraction:
+            mode = DEGRADED
+        else:
+            mode = NORMAL
+        if mode != self._mode:
+            logging.warning(
+                "GitHub API budget is %s: %s of %s requests left until %s",
+                mode,
+                self.remaining,
+                self.limit,
+                self.reset_at,
+            )
+            self._mode = mode
+        return mode
@@ -0,0 +1,68 @@
+"""Layout of the database in sql.js-httpvfs "chunked" server mode.
+
+The database is split in fixed-size files named ``db.sqlite3.000``,
+``db.sqlite3.001``... next to a ``config.json`` telling sql.js-httpvfs how to
+put them back together. For extra info refer to:
+https://github.com/phiresky/sql.js-httpvfs#usage
+"""
+
+from collections import namedtuple
+from hashlib import sha1
+from json import dumps
+
+CHUNK_URL_PREFIX = "db.sqlite3."
+CONFIG_FILE_NAME = "config.json"
+
+ChunkEntry = namedtuple("ChunkEntry", ["path", "sha", "size"])
+
+
+class ChunkedDbMetadata:
+    """What a local copy was cloned from when the database is chunked."""
+
+    def __init__(self, commit_sha, tree_sha, chunks, config_sha):
+        self.commit_sha = commit_sha
+        self.tree_sha = tree_sha
+        self.chunks = chunks
+        self.config_sha = config_sha
+
+
+def git_blob_sha(data):
+    """Return the SHA git gives a blob holding ``data``."""
+    return sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def chunk_index(path):
+    """Return the index of a chunk file, None for any other file."""
+    suffix = path[len(CHUNK_URL_PREFIX) :]
+    if path.startswith(CHUNK_URL_PREFIX) and suffix.isdigit():
+        return int(suffix)
+    return None
+
+
+def split_into_chunks(content, chunk_size):
+    """Return ``(ChunkEntry, bytes)`` pairs for each chunk of ``content``."""
+    parts = [
+        content[offset : offset + chunk_size]
+        for offset in range(0, len(content), chunk_size)
+    ]
+    suffix_length = max(3, len(str(len(parts) - 1)))
+    chunks = []
+    for index, part in enumerate(parts):
+        path = f"{CHUNK_URL_PREFIX}{index:0{suffix_length}d}"
+        chunks.append((ChunkEntry(path, git_blob_sha(part), len(part)), part))
+    return chunks
+
+
+def build_config(content, chunk_size, chunks):
+    # SQLite stores the page size big-endian at offset 16, 1 stands for 65536.
+    page_size = int.from_bytes(content[16:18], "big")
+    suffix_length = len(chunks[0].path) - len(CHUNK_URL_PREFIX) if chunks else 3
+    config = {
+        "serverMode": "chunked",
+        "requestChunkSize": 65536 if page_size == 1 else page_size or 4096,
+        "databaseLengthBytes": len(content),
+        "serverChunkSize": chunk_size,
+        "urlPrefix": CHUNK_URL_PREFIX,
+        "suffixLength": suffix_length,
+    }
+    return dumps(config, indent=2).encode()
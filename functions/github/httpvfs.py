@@ -0,0 +1,196 @@
+"""Tuning of the published database for sql.js-httpvfs.
+
+The dashboard reads the database with HTTP range requests, so it loads faster
+the fewer pages its queries read and the more of them sit next to each other.
+For extra info refer to: https://github.com/phiresky/sql.js-httpvfs#usage
+
+Compare a database before and after the optimization with:
+
+    python -m functions.github.httpvfs database.db
+"""
+
+import re
+import sqlite3
+import sys
+from pathlib import Path
+from shutil import copyfile
+from tempfile import TemporaryDirectory
+
+# Only the dashboard needs these, they let it list the active meetings from
+# the index alone instead of also reading their rows.
+COVERING_INDEXES = {
+    "meeting": (
+        "CREATE INDEX IF NOT EXISTS ix_meeting_active_covering ON meeting "
+        "(date_started, id, name, link, date_ended) WHERE date_ended IS NULL"
+    ),
+}
+
+# The queries the dashboard runs when it loads.
+DASHBOARD_QUERIES = {
+    "active meetings": (
+        "SELECT id, name, date_started, date_ended, link FROM meeting "
+        "WHERE date_ended IS NULL ORDER BY date_started DESC, id DESC"
+    ),
+    "meetings history": (
+        "SELECT id, name, date_started, date_ended, link FROM meeting "
+        "ORDER BY date_started DESC, id DESC LIMIT 50"
+    ),
+    "meeting participants": (
+        "SELECT participant.name FROM meetings_participants "
+        "JOIN participant ON participant.id = meetings_participants.participant_id "
+        "WHERE meetings_participants.meeting_id = 1"
+    ),
+    "meeting labels": (
+        "SELECT label.name FROM meetings_labels "
+        "JOIN label ON label.id = meetings_labels.label_id "
+        "WHERE meetings_labels.meeting_id = 1"
+    ),
+    "label stats": (
+        "SELECT label.name, label_stats.meeting_count FROM label_stats "
+        "JOIN label ON label.id = label_stats.label_id"
+    ),
+    "participant stats": (
+        "SELECT participant.name, participant_stats.meeting_count, "
+        "participant_stats.total_minutes FROM participant_stats "
+        "JOIN participant ON participant.id = participant_stats.participant_id"
+    ),
+    "daily stats": "SELECT day, meeting_count FROM daily_stats ORDER BY day",
+}
+
+PLAN_STEP = re.compile(
+    r"(?P<operation>SCAN|SEARCH) (?P<table>\w+)"
+    r"(?: USING (?P<covering>COVERING )?INDEX (?P<index>\w+))?"
+)
+
+
+def optimize(path, page_size):
+    """Rewrite the database at ``path`` into a compact and analyzed file.
+
+    VACUUM moves every page, so in chunked mode the push after it changes
+    more chunks than the write alone would have.
+    """
+    connection = sqlite3.connect(path, isolation_level=None)
+    try:
+        # sql.js-httpvfs can't read a database in WAL mode.
+        connection.execute("PRAGMA journal_mode = DELETE")
+        tables = {
+            name
+            for name, in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            )
+        }
+        for table, statement in COVERING_INDEXES.items():
+            if table in tables:
+                connection.execute(statement)
+        connection.execute("ANALYZE")
+        # The page size only changes when the database is rebuilt by VACUUM.
+        connection.execute(f"PRAGMA page_size = {int(page_size)}")
+        connection.execute("VACUUM")
+    finally:
+        connection.close()
+
+
+def measure(path):
+    """Estimate the pages and range requests each of DASHBOARD_QUERIES needs.
+
+    The first step of a query plan runs once, the later ones once per row of
+    the result. A scan reads the leaves holding the newest rows it returns, a
+    search and a row looked up from a non-covering index read one path of
+    their b-tree. Pages read once are cached, consecutive pages are fetched
+    by a single range request, and every page of a path whose leaf can't be
+    known from the plan alone is counted as a request of its own.
+    """
+    connection = sqlite3.connect(path)
+    try:
+        trees = {}
+        for name, page_path, page_number, page_type, cell_count in connection.execute(
+            "SELECT name, path, pageno, pagetype, ncell FROM dbstat"
+            " WHERE pagetype != 'overflow' ORDER BY name, path"
+        ):
+            trees.setdefault(name, []).append(
+                (page_path, page_number, page_type, cell_count)
+            )
+
+        report = {}
+        for query_name, query in DASHBOARD_QUERIES.items():
+            row_count = len(connection.execute(query).fetchall())
+            pages, unknown_pages = set(), 0
+            plan = connection.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+            for step_number, (_, _, _, detail) in enumerate(plan):
+                step = PLAN_STEP.match(detail)
+                if step is None:
+                    continue
+                runs = 1 if step_number == 0 else row_count
+                tree = trees[step["index"] or step["table"]]
+                if step["operation"] == "SCAN":
+                    pages.update(read_newest_leaves(tree, row_count))
+                else:
+                    unknown_pages += read_paths(tree, runs, pages)
+                if step["index"] and not step["covering"]:
+                    unknown_pages += read_paths(trees[step["table"]], row_count, pages)
+            report[query_name] = (
+                len(pages) + unknown_pages,
+                count_ranges(sorted(pages)) + unknown_pages,
+            )
+        return report
+    finally:
+        connection.close()
+
+
+def read_newest_leaves(tree, row_count):
+    """Return the pages read to get the last ``row_count`` entries of ``tree``."""
+    pages_by_path = {page_path: page_number for page_path, page_number, _, _ in tree}
+    leaves = [page for page in tree if page[2] == "leaf"]
+    pages, entries = set(), 0
+    for page_path, page_number, _, cell_count in reversed(leaves):
+        pages.add(page_number)
+        # The parents of a leaf are the pages at the prefixes of its path.
+        for end in range(1, len(page_path) - 1):
+            if page_path[end - 1] == "/":
+                pages.add(pages_by_path[page_path[:end]])
+        entries += cell_count
+        if entries >= row_count:
+            break
+    return pages
+
+
+def read_paths(tree, count, pages):
+    """Add the root of ``tree`` to ``pages``, return the other pages searched.
+
+    ``count`` searches read a path each, but no more than the whole tree since
+    the pages are cached.
+    """
+    pages.add(tree[0][1])
+    depth = max(page_path.count("/") for page_path, _, _, _ in tree)
+    return min(count * (depth - 1), len(tree) - 1)
+
+
+def count_ranges(page_numbers):
+    return sum(
+        1
+        for index, page_number in enumerate(page_numbers)
+        if index == 0 or page_number != page_numbers[index - 1] + 1
+    )
+
+
+def main(path, page_size=1024):
+    with TemporaryDirectory() as directory:
+        optimized_path = Path(directory).joinpath("optimized.db")
+        copyfile(path, optimized_path)
+        before = measure(path)
+        optimize(optimized_path, page_size)
+        after = measure(optimized_path)
+    connection = sqlite3.connect(path)
+    page_size_before = connection.execute("PRAGMA page_size").fetchone()[0]
+    connection.close()
+
+    print(f"page size: {page_size_before} -> {page_size} bytes")
+    print(f"{'query':<24}{'pages':>16}{'ranges':>16}")
+    for query_name in DASHBOARD_QUERIES:
+        pages = f"{before[query_name][0]} -> {after[query_name][0]}"
+        ranges = f"{before[query_name][1]} -> {after[query_name][1]}"
+        print(f"{query_name:<24}{pages:>16}{ranges:>16}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 1024)
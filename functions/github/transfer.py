@@ -0,0 +1,121 @@
+"""Git blobs streamed through the GitHub REST API.
+
+PyGithub reads a blob as base64 inside a JSON document and needs the whole
+content in memory to create one, and the contents API stops returning files
+over 1 MB. Here downloads stream the raw blob, gzipped on the wire if asked
+to, and uploads stream the JSON document while base64 encoding the content,
+so only a chunk is held besides the content's source and destination. Both
+check the content against its blob SHA.
+"""
+
+from base64 import b64encode
+from hashlib import sha1
+
+from github import GithubException
+
+RAW_MEDIA_TYPE = "application/vnd.github.raw"
+
+
+class BlobIntegrityError(Exception):
+    def __init__(self, expected_sha, actual_sha):
+        super().__init__(f"Expected blob {expected_sha}, got {actual_sha}")
+        self.expected_sha = expected_sha
+        self.actual_sha = actual_sha
+
+
+def blob_hasher(size):
+    """Return a SHA-1 to feed the content of a ``size`` bytes blob to."""
+    return sha1(b"blob %d\0" % size)
+
+
+def download_blob(
+    http, blobs_url, sha, size, destination, chunk_size, compress, timeout
+):
+    """Write the content of blob ``sha`` to the ``destination`` file object.
+
+    ``size`` is the blob's size as listed in its tree, a blob whose content
+    doesn't hash to ``sha`` raises a BlobIntegrityError.
+    """
+    headers = {"Accept": RAW_MEDIA_TYPE}
+    if not compress:
+        headers["Accept-Encoding"] = "identity"
+    hasher = blob_hasher(size)
+    with http.get(
+        f"{blobs_url}/{sha}", headers=headers, stream=True, timeout=timeout
+    ) as response:
+        raise_for_status(response)
+        # Chunks are decompressed as they arrive.
+        for chunk in response.iter_content(chunk_size):
+            hasher.update(chunk)
+            destination.write(chunk)
+    if hasher.hexdigest() != sha:
+        raise BlobIntegrityError(sha, hasher.hexdigest())
+
+
+def upload_blob(http, blobs_url, source, size, chunk_size, timeout):
+    """Create a blob from the ``size`` bytes read from ``source``, return its SHA."""
+    body = Base64BlobBody(source, size, chunk_size)
+    response = http.post(
+        blobs_url,
+        data=body,
+        headers={"Content-Type": "application/json"},
+        timeout=timeout,
+    )
+    raise_for_status(response)
+    sha = response.json()["sha"]
+    if sha != body.hasher.hexdigest():
+        raise BlobIntegrityError(body.hasher.hexdigest(), sha)
+    return sha
+
+
+class Base64BlobBody:
+    """JSON body creating a blob, encoded from its source as it is sent.
+
+    Its length is known upfront, so it is sent with a Content-Length.
+    """
+
+    PREFIX = b'{"encoding": "base64", "content": "'
+    SUFFIX = b'"}'
+
+    def __init__(self, source, size, chunk_size):
+        self.source = source
+        self.hasher = blob_hasher(size)
+        # Only the last chunk may need base64 padding.
+        self.chunk_size = max(3, chunk_size - chunk_size % 3)
+        self.length = len(self.PREFIX) + 4 * -(-size // 3) + len(self.SUFFIX)
+        self._parts = self._encode()
+        self._buffer = b""
+
+    def __len__(self):
+        return self.length
+
+    def _encode(self):
+        yield self.PREFIX
+        while True:
+            chunk = self.source.read(self.chunk_size)
+            if not chunk:
+                break
+            self.hasher.update(chunk)
+            yield b64encode(chunk)
+        yield self.SUFFIX
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            part = next(self._parts, None)
+            if part is None:
+                break
+            self._buffer += part
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def raise_for_status(response):
+    # Raised like PyGithub does, so callers handle a single exception type.
+    if response.status_code >= 400:
+        try:
+            data = response.json()
+        except ValueError:
+            data = response.text
+        raise GithubException(response.status_code, data, dict(response.headers))
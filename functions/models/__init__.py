@@ -1,50 +1,360 @@
 import os
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from io import BytesIO
+from itertools import count as version_numbers
 from pathlib import Path
 from sqlalchemy import (
+    DDL,
     Column,
     Integer,
     String,
+    Text,
+    Date,
     DateTime,
     ForeignKey,
     create_engine,
     Table,
     Boolean,
+    Index,
+    column,
+    delete,
+    event,
+    func,
+    insert,
+    literal_column,
+    select,
+    table,
+    text,
 )
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import scoped_session, sessionmaker, relationship
 
 RUNNING_IN_AZURE = os.getenv("RUNNING_IN_AZURE", False)
 if RUNNING_IN_AZURE:
     database_location = Path("/tmp").joinpath("database.db")
 else:
     database_location = Path().cwd().joinpath("database.db")
-engine_path = f"sqlite:///{database_location}"
+# "memory" keeps the local database in an in-memory SQLite database loaded
+# from and dumped to the bytes published on GitHub, which is where it is
+# durable, so nothing is written to or fsynced on the temporary storage.
+# "file" keeps it at database_location, which is also used where sqlite3
+# can't deserialize (before Python 3.11) and when the database is rewritten
+# for sql.js-httpvfs, as an in-memory database can't change its page size.
+# The file isn't fsynced either, see skip_db_file_durability.
+DB_STORAGE = os.getenv("DB_STORAGE", "memory")
+DB_IN_MEMORY = (
+    DB_STORAGE == "memory"
+    and hasattr(sqlite3.Connection, "deserialize")
+    and os.getenv("DB_OPTIMIZE_FOR_HTTPVFS", "false") != "true"
+)
+# Connections to a memdb name starting with "/" share the same database.
+MEMORY_DB_URI = "file:/database.db?vfs=memdb"
+if DB_IN_MEMORY:
+    engine_path = f"sqlite:///{MEMORY_DB_URI}&uri=true"
+else:
+    engine_path = f"sqlite:///{database_location}"
 
 
 engine = create_engine(engine_path)
+
+
+class ReadWriteLock:
+    """Shared by the threads reading the local database, exclusive for writing.
+
+    Writers waiting go before new readers, except threads already reading,
+    so nested reads don't deadlock. A thread's own reads don't block its
+    writes.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = Counter()
+        self._writer = None
+        self._waiting_writers = 0
+
+    def acquire_read(self, owner):
+        with self._condition:
+            while (self._writer not in (None, owner)) or (
+                self._waiting_writers and owner not in self._readers
+            ):
+                self._condition.wait()
+            self._readers[owner] += 1
+
+    def release_read(self, owner):
+        with self._condition:
+            self._readers[owner] -= 1
+            if not self._readers[owner]:
+                del self._readers[owner]
+                self._condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        owner = threading.get_ident()
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer is not None or set(self._readers) - {owner}:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = owner
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = None
+                self._condition.notify_all()
+
+
+# Connections read the database file from checkout to checkin, the file is
+# only replaced or rewritten outside of SQLite while none is checked out.
+db_file_lock = ReadWriteLock()
+
+
+@event.listens_for(engine, "checkout")
+def acquire_db_file(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info["db_file_reader"] = threading.get_ident()
+    db_file_lock.acquire_read(connection_record.info["db_file_reader"])
+
+
+@event.listens_for(engine, "checkin")
+def release_db_file(dbapi_connection, connection_record):
+    reader = connection_record.info.pop("db_file_reader", None)
+    if reader is not None:
+        db_file_lock.release_read(reader)
+
+
+# The in-memory database lives as long as a connection to it is open, this
+# one is kept open between loads. Its version changes with every load and
+# every commit.
+_memory_db = None
+_memory_db_version = None
+_memory_db_versions = version_numbers(1)
+
+
+if DB_IN_MEMORY:
+
+    @event.listens_for(engine, "commit")
+    def bump_memory_db_version(connection):
+        global _memory_db_version
+        _memory_db_version = next(_memory_db_versions)
+
+
+def get_local_db_version():
+    """Return a value that changes whenever the local database does.
+
+    SQLite bumps the file change counter (header offset 24) on every commit,
+    the in-memory database is numbered on every load and commit instead.
+    """
+    if DB_IN_MEMORY:
+        return _memory_db_version
+    try:
+        stat = database_location.stat()
+        with open(database_location, "rb") as db_file:
+            change_counter = db_file.read(28)[24:]
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns, change_counter)
+
+
+def load_local_db(content):
+    """Replace the local database with ``content``, a whole database file."""
+    global _memory_db, _memory_db_version
+    with db_file_lock.writing():
+        if not DB_IN_MEMORY:
+            with open(database_location, "wb") as db_file:
+                db_file.write(content)
+            return
+        # A backup can't change the page size of an in-memory database, so
+        # the previous one is dropped along with every connection to it.
+        engine.dispose()
+        if _memory_db is not None:
+            _memory_db.close()
+        _memory_db = sqlite3.connect(MEMORY_DB_URI, uri=True, check_same_thread=False)
+        staging_db = sqlite3.connect(":memory:")
+        staging_db.deserialize(content)
+        staging_db.backup(_memory_db)
+        staging_db.close()
+        _memory_db_version = next(_memory_db_versions)
+
+
+@contextmanager
+def local_db_download():
+    """Yield a binary file to write a whole database to, loaded once it's done.
+
+    The file is written next to the local database and swapped in for it, so
+    a download failing halfway leaves the local database as it was.
+    """
+    if DB_IN_MEMORY:
+        download = BytesIO()
+        yield download
+        load_local_db(download.getbuffer())
+        return
+    download_location = database_location.with_name(
+        f"{database_location.name}.download"
+    )
+    try:
+        with open(download_location, "wb") as download:
+            yield download
+        with db_file_lock.writing():
+            os.replace(download_location, database_location)
+            # Pooled connections still have the replaced file open.
+            engine.dispose()
+    finally:
+        if download_location.exists():
+            download_location.unlink()
+
+
+def patch_local_db(changes, size):
+    """Write the ``(offset, content)`` changes and truncate to ``size`` bytes."""
+    if DB_IN_MEMORY:
+        content = bytearray(dump_local_db() or b"")
+        for offset, change in changes:
+            content.extend(bytes(max(0, offset - len(content))))
+            content[offset : offset + len(change)] = change
+        load_local_db(bytes(content[:size]))
+        return
+    with db_file_lock.writing(), open(
+        database_location, "r+b" if database_location.exists() else "wb"
+    ) as db_file:
+        for offset, change in changes:
+            db_file.seek(offset)
+            db_file.write(change)
+        db_file.truncate(size)
+
+
+def open_local_db():
+    """Return the local database as a binary file object, None if missing."""
+    if DB_IN_MEMORY:
+        content = dump_local_db()
+        return None if content is None else BytesIO(content)
+    try:
+        return open(database_location, "rb")
+    except FileNotFoundError:
+        return None
+
+
+def dump_local_db():
+    """Return the local database as the bytes of a database file, None if missing."""
+    if DB_IN_MEMORY:
+        if _memory_db_version is None:
+            return None
+        return _memory_db.serialize()
+    try:
+        with open(database_location, "rb") as db_file:
+            return db_file.read()
+    except FileNotFoundError:
+        return None
+
+
+def vacuum_local_db():
+    """Rebuild the local database without its free pages.
+
+    VACUUM can't run in a transaction, the session must have let go of the
+    database first.
+    """
+    global _memory_db_version
+    with db_file_lock.writing():
+        connection = engine.raw_connection()
+        try:
+            connection.cursor().execute("VACUUM")
+        finally:
+            connection.close()
+        if DB_IN_MEMORY:
+            # Run outside the engine's transactions, which bump it on commit.
+            _memory_db_version = next(_memory_db_versions)
+
+
+def delete_local_db():
+    global _memory_db, _memory_db_version
+    engine.dispose()
+    if _memory_db is not None:
+        _memory_db.close()
+        _memory_db, _memory_db_version = None, None
+    if database_location.exists():
+        database_location.unlink()
+
+
+@event.listens_for(engine, "connect")
+def disable_pysqlite_transaction_handling(dbapi_connection, connection_record):
+    # pysqlite only emits BEGIN before DML statements, so releasing the first
+    # SAVEPOINT would commit everything. SQLAlchemy emits BEGIN itself instead.
+    dbapi_connection.isolation_level = None
+
+
+if not DB_IN_MEMORY:
+
+    @event.listens_for(engine, "connect")
+    def skip_db_file_durability(dbapi_connection, connection_record):
+        # The file is a local copy of the database published on GitHub, which
+        # is where it is durable, so commits neither fsync it nor write a
+        # rollback journal next to it. Neither setting is stored in the file.
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA synchronous = OFF")
+        cursor.execute("PRAGMA journal_mode = MEMORY")
+        cursor.close()
+
+
+@event.listens_for(engine, "begin")
+def begin_transaction(connection):
+    connection.exec_driver_sql("BEGIN")
+
+
 Session = sessionmaker(bind=engine)
 Base = declarative_base()
-session = Session()
+# A session per thread, each request removes its own once it's done.
+session = scoped_session(Session)
+
+
+# Stored in the database's user_version once its tables are created, bump it
+# whenever a model adds a table.
+SCHEMA_VERSION = 5
 
 
 def create_tables():
-    Base.metadata.create_all(engine)
+    """Create missing tables unless the database already has SCHEMA_VERSION.
+
+    Reading the marker is a single pragma, which saves reflecting the whole
+    schema on every write. The tables are created in the session's
+    transaction, so they are committed along with the write needing them.
+    """
+    connection = session.connection()
+    user_version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+    if user_version >= SCHEMA_VERSION:
+        return
+    existing_tables = set(
+        connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        ).scalars()
+    )
+    Base.metadata.create_all(connection)
+    # The database may have meetings from before the summary tables and the
+    # search index existed, they are only filled in when they are created.
+    if DailyStats.__tablename__ not in existing_tables:
+        rebuild_stats(connection)
+    if "meeting_search" not in existing_tables:
+        rebuild_search_index(connection)
+    connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
 
 
 class BaseModel(Base):
+    """Changes are flushed, the write operation commits them as a whole."""
+
     __abstract__ = True
 
     def insert(self):
         session.add(self)
-        session.commit()
+        session.flush()
 
     @staticmethod
     def update():
-        session.commit()
+        session.flush()
 
     def delete(self):
         session.delete(self)
-        session.commit()
+        session.flush()
 
 
 participants_association_table = Table(
@@ -52,6 +362,8 @@ participants_association_table = Table(
     Base.metadata,
     Column("meeting_id", ForeignKey("meeting.id"), primary_key=True),
     Column("participant_id", ForeignKey("participant.id"), primary_key=True),
+    # The primary key leads with meeting_id, this one finds a participant's meetings.
+    Index("ix_meetings_participants_participant_id", "participant_id", "meeting_id"),
 )
 
 labels_association_table = Table(
@@ -59,6 +371,7 @@ labels_association_table = Table(
     Base.metadata,
     Column("meeting_id", ForeignKey("meeting.id"), primary_key=True),
     Column("label_id", ForeignKey("label.id"), primary_key=True),
+    Index("ix_meetings_labels_label_id", "label_id", "meeting_id"),
 )
 
 
@@ -73,6 +386,19 @@ class Meeting(BaseModel):
         "Participant", secondary="meetings_participants", backref="meetings"
     )
     labels = relationship("Label", secondary="meetings_labels", backref="meetings")
+    __table_args__ = (
+        # Only the few active meetings, in the order the history lists them.
+        Index(
+            "ix_meeting_active",
+            "date_started",
+            "id",
+            sqlite_where=text("date_ended IS NULL"),
+        ),
+        Index("ix_meeting_date_started", "date_started", "id"),
+        # Ids of deleted or archived meetings are never handed out again, an
+        # archived meeting keeps its id in its archive.
+        {"sqlite_autoincrement": True},
+    )
 
     def __init__(self, name, date_started, date_ended=None, link=""):
         self.name = name
@@ -85,7 +411,6 @@ class Meeting(BaseModel):
             self.participants.append(child)
         elif child.__tablename__ == "label":
             self.labels.append(child)
-        session.commit()
 
     def __repr__(self):
         return f"Meeting(id={self.id}, name={self.name}, date_started={self.date_started.strftime('%B %d, %Y - %I:%M %p')})"
@@ -95,6 +420,9 @@ class Participant(BaseModel):
     __tablename__ = "participant"
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     name = Column(String(80), nullable=False, unique=True)
+    __table_args__ = (
+        Index("ix_participant_name_nocase", text("name COLLATE NOCASE"), unique=True),
+    )
 
     def __init__(self, name):
         self.name = name
@@ -107,9 +435,396 @@ class Label(BaseModel):
     __tablename__ = "label"
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     name = Column(String(80), nullable=False, unique=True)
+    __table_args__ = (
+        Index("ix_label_name_nocase", text("name COLLATE NOCASE"), unique=True),
+    )
 
     def __init__(self, name):
         self.name = name
 
     def __repr__(self):
         return f"Label(id={self.id}, name={self.name})"
+
+
+# Summary tables the dashboard reads its statistics from instead of going
+# through the whole history. The write handlers keep them up to date with
+# update_meeting_stats, rebuild_stats recomputes them from scratch.
+class LabelStats(Base):
+    __tablename__ = "label_stats"
+    label_id = Column(Integer, ForeignKey("label.id"), primary_key=True)
+    meeting_count = Column(Integer, nullable=False)
+
+
+class ParticipantStats(Base):
+    __tablename__ = "participant_stats"
+    participant_id = Column(Integer, ForeignKey("participant.id"), primary_key=True)
+    meeting_count = Column(Integer, nullable=False)
+    total_minutes = Column(Integer, nullable=False)
+
+
+class DailyStats(Base):
+    __tablename__ = "daily_stats"
+    day = Column(Date, primary_key=True)
+    meeting_count = Column(Integer, nullable=False)
+
+
+# What the archived meetings add to the summary tables above, which
+# rebuild_stats can't count from the meetings left in the database.
+class ArchivedLabelStats(Base):
+    __tablename__ = "archived_label_stats"
+    label_id = Column(Integer, ForeignKey("label.id"), primary_key=True)
+    meeting_count = Column(Integer, nullable=False)
+
+
+class ArchivedParticipantStats(Base):
+    __tablename__ = "archived_participant_stats"
+    participant_id = Column(Integer, ForeignKey("participant.id"), primary_key=True)
+    meeting_count = Column(Integer, nullable=False)
+    total_minutes = Column(Integer, nullable=False)
+
+
+class ArchivedDailyStats(Base):
+    __tablename__ = "archived_daily_stats"
+    day = Column(Date, primary_key=True)
+    meeting_count = Column(Integer, nullable=False)
+
+
+class IdempotencyKey(Base):
+    """Response of a write sent with an Idempotency-Key header."""
+
+    __tablename__ = "idempotency_key"
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=False)
+    mimetype = Column(String(100), nullable=False)
+    body = Column(Text, nullable=False)
+    # Keys are forgotten once expired, oldest first.
+    created_at = Column(DateTime, nullable=False, index=True)
+
+
+# Same statements as in the migration adding the summary tables. A meeting's
+# minutes are counted from whole seconds, like meeting_minutes does.
+REBUILD_STATS_STATEMENTS = (
+    "DELETE FROM label_stats",
+    "DELETE FROM participant_stats",
+    "DELETE FROM daily_stats",
+    """
+    INSERT INTO label_stats (label_id, meeting_count)
+    SELECT label_id, COUNT(*) FROM meetings_labels GROUP BY label_id
+    """,
+    """
+    INSERT INTO participant_stats (participant_id, meeting_count, total_minutes)
+    SELECT
+        meetings_participants.participant_id,
+        COUNT(*),
+        COALESCE(SUM(
+            (strftime('%s', meeting.date_ended) - strftime('%s', meeting.date_started))
+            / 60
+        ), 0)
+    FROM meetings_participants
+    JOIN meeting ON meeting.id = meetings_participants.meeting_id
+    GROUP BY meetings_participants.participant_id
+    """,
+    """
+    INSERT INTO daily_stats (day, meeting_count)
+    SELECT date(date_started), COUNT(*) FROM meeting GROUP BY date(date_started)
+    """,
+)
+
+
+# The archived meetings are added on top of the meetings in the database.
+ADD_ARCHIVED_STATS_STATEMENTS = (
+    """
+    INSERT INTO label_stats (label_id, meeting_count)
+    SELECT label_id, meeting_count FROM archived_label_stats WHERE true
+    ON CONFLICT (label_id) DO UPDATE
+    SET meeting_count = meeting_count + excluded.meeting_count
+    """,
+    """
+    INSERT INTO participant_stats (participant_id, meeting_count, total_minutes)
+    SELECT participant_id, meeting_count, total_minutes
+    FROM archived_participant_stats WHERE true
+    ON CONFLICT (participant_id) DO UPDATE
+    SET meeting_count = meeting_count + excluded.meeting_count,
+        total_minutes = total_minutes + excluded.total_minutes
+    """,
+    """
+    INSERT INTO daily_stats (day, meeting_count)
+    SELECT day, meeting_count FROM archived_daily_stats WHERE true
+    ON CONFLICT (day) DO UPDATE
+    SET meeting_count = meeting_count + excluded.meeting_count
+    """,
+)
+
+
+def rebuild_stats(connection):
+    """Recompute the summary tables from the meetings, fixing any drift.
+
+    The meetings in the database are counted, along with what the archived
+    ones added, recorded by add_archived_stats when they were archived.
+    """
+    for statement in REBUILD_STATS_STATEMENTS + ADD_ARCHIVED_STATS_STATEMENTS:
+        connection.exec_driver_sql(statement)
+
+
+def add_archived_stats(meeting_ids):
+    """Record what the meetings of ``meeting_ids``, about to be archived, count.
+
+    The summary tables keep counting them, this is what lets rebuild_stats
+    count them again once they are gone from the database.
+    """
+    participant_meetings = participants_association_table.c
+    label_meetings = labels_association_table.c
+    # Whole minutes from whole seconds, like REBUILD_STATS_STATEMENTS.
+    minutes = literal_column(
+        "(strftime('%s', meeting.date_ended) - strftime('%s', meeting.date_started))"
+        " / 60"
+    )
+    add_to_stats_from(
+        ArchivedLabelStats,
+        ArchivedLabelStats.label_id,
+        select(label_meetings.label_id, func.count())
+        .where(label_meetings.meeting_id.in_(meeting_ids))
+        .group_by(label_meetings.label_id),
+    )
+    add_to_stats_from(
+        ArchivedParticipantStats,
+        ArchivedParticipantStats.participant_id,
+        select(
+            participant_meetings.participant_id,
+            func.count(),
+            func.coalesce(func.sum(minutes), 0),
+        )
+        .join(Meeting, Meeting.id == participant_meetings.meeting_id)
+        .where(participant_meetings.meeting_id.in_(meeting_ids))
+        .group_by(participant_meetings.participant_id),
+    )
+    day = func.date(Meeting.date_started)
+    add_to_stats_from(
+        ArchivedDailyStats,
+        ArchivedDailyStats.day,
+        select(day, func.count()).where(Meeting.id.in_(meeting_ids)).group_by(day),
+    )
+
+
+def add_to_stats_from(model, key, rows):
+    """Add the counts selected by ``rows``, in column order, to ``model``."""
+    columns = [column.name for column in model.__table__.columns]
+    statement = sqlite_insert(model.__table__).from_select(columns, rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[key.name],
+        set_={
+            column: statement.table.c[column] + statement.excluded[column]
+            for column in columns
+            if column != key.name
+        },
+    )
+    session.execute(statement)
+
+
+def meeting_minutes(meeting):
+    if meeting.date_ended is None:
+        return 0
+    date_ended = meeting.date_ended.replace(microsecond=0)
+    date_started = meeting.date_started.replace(microsecond=0)
+    return int((date_ended - date_started).total_seconds()) // 60
+
+
+class MeetingStats:
+    """What a meeting adds to the summary tables at some point in time."""
+
+    def __init__(self, meeting):
+        self.day = meeting.date_started.date()
+        self.participant_ids = [participant.id for participant in meeting.participants]
+        self.label_ids = [label.id for label in meeting.labels]
+        self.minutes = meeting_minutes(meeting)
+
+
+def update_meeting_stats(before, after):
+    """Move the summary tables from a meeting's ``before`` to its ``after`` stats.
+
+    ``before`` is None for a new meeting and ``after`` for a deleted one. Only
+    the rows of the days, labels and participants involved are touched.
+    """
+    days, labels, participants, minutes = Counter(), Counter(), Counter(), Counter()
+    for meeting_stats, sign in ((before, -1), (after, 1)):
+        if meeting_stats is None:
+            continue
+        days[meeting_stats.day] += sign
+        for label_id in meeting_stats.label_ids:
+            labels[label_id] += sign
+        for participant_id in meeting_stats.participant_ids:
+            participants[participant_id] += sign
+            minutes[participant_id] += sign * meeting_stats.minutes
+
+    add_to_stats(
+        DailyStats,
+        DailyStats.day,
+        [{"day": day, "meeting_count": count} for day, count in days.items() if count],
+    )
+    add_to_stats(
+        LabelStats,
+        LabelStats.label_id,
+        [
+            {"label_id": label_id, "meeting_count": count}
+            for label_id, count in labels.items()
+            if count
+        ],
+    )
+    add_to_stats(
+        ParticipantStats,
+        ParticipantStats.participant_id,
+        [
+            {
+                "participant_id": participant_id,
+                "meeting_count": participants[participant_id],
+                "total_minutes": minutes[participant_id],
+            }
+            for participant_id in participants
+            if participants[participant_id] or minutes[participant_id]
+        ],
+    )
+
+
+def add_to_stats(model, key, deltas):
+    """Add ``deltas`` to the rows of ``model``, dropping those left with no meeting."""
+    if not deltas:
+        return
+    statement = sqlite_insert(model.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=[key.name],
+        set_={
+            column: statement.table.c[column] + statement.excluded[column]
+            for column in deltas[0]
+            if column != key.name
+        },
+    )
+    session.execute(statement, deltas)
+    session.execute(
+        delete(model).where(
+            key.in_([delta[key.name] for delta in deltas]), model.meeting_count <= 0
+        )
+    )
+
+
+def delete_stats(resource):
+    """Drop the summary rows of a participant or label being deleted."""
+    if isinstance(resource, Participant):
+        for model in (ParticipantStats, ArchivedParticipantStats):
+            session.execute(delete(model).where(model.participant_id == resource.id))
+    elif isinstance(resource, Label):
+        for model in (LabelStats, ArchivedLabelStats):
+            session.execute(delete(model).where(model.label_id == resource.id))
+
+
+# Full-text index of the meetings by name, participant and label names, the
+# meeting id being the rowid. The dashboard searches it through sql.js-httpvfs
+# and GET dashboard/meetings?q= through the session, with prefix queries such
+# as '"jo"*' answered from the prefix index in a few pages. It keeps its own
+# copy of the text, so a row can be replaced without knowing what it held.
+meeting_search = table(
+    "meeting_search",
+    column("rowid"),
+    column("name"),
+    column("participants"),
+    column("labels"),
+)
+event.listen(
+    Base.metadata,
+    "after_create",
+    DDL(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS meeting_search USING fts5("
+        "name, participants, labels, prefix='2 3',"
+        " tokenize='unicode61 remove_diacritics 2')"
+    ),
+)
+
+
+def select_search_rows():
+    """Select the meeting_search row of every meeting."""
+    participant_names = (
+        select(func.group_concat(Participant.name, " "))
+        .join_from(participants_association_table, Participant)
+        .where(participants_association_table.c.meeting_id == Meeting.id)
+        .scalar_subquery()
+    )
+    label_names = (
+        select(func.group_concat(Label.name, " "))
+        .join_from(labels_association_table, Label)
+        .where(labels_association_table.c.meeting_id == Meeting.id)
+        .scalar_subquery()
+    )
+    return select(
+        Meeting.id,
+        Meeting.name,
+        func.coalesce(participant_names, ""),
+        func.coalesce(label_names, ""),
+    )
+
+
+def rebuild_search_index(connection):
+    """Index every meeting again, from an empty meeting_search."""
+    connection.execute(delete(meeting_search))
+    connection.execute(
+        insert(meeting_search).from_select(
+            ["rowid", "name", "participants", "labels"], select_search_rows()
+        )
+    )
+
+
+def update_search_index(meeting_ids):
+    """Index the meetings of ``meeting_ids`` again, dropping the deleted ones.
+
+    Write handlers call it with the meetings whose name, participants or
+    labels they changed, once the change is flushed.
+    """
+    if not meeting_ids:
+        return
+    session.execute(
+        delete(meeting_search).where(meeting_search.c.rowid.in_(meeting_ids))
+    )
+    session.execute(
+        insert(meeting_search).from_select(
+            ["rowid", "name", "participants", "labels"],
+            select_search_rows().where(Meeting.id.in_(meeting_ids)),
+        )
+    )
+
+
+def search_index_exists():
+    """Whether the database has meeting_search yet, create_tables adds it."""
+    return (
+        session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+            {"name": meeting_search.name},
+        ).first()
+        is not None
+    )
+
+
+def search_query(terms):
+    """Turn what a user typed into an FTS5 query matching meetings with every word.
+
+    Each word is quoted, so FTS5 operators are searched as plain text, and
+    matched as a prefix. Words the tokenizer drops, like punctuation, would
+    match nothing and are left out, None is returned when no word is left.
+    """
+    words = [
+        '"{}"*'.format(word.replace('"', '""'))
+        for word in terms.split()
+        if any(character.isalnum() for character in word)
+    ]
+    return " ".join(words) or None
+
+
+def select_matching_meeting_ids(terms):
+    """Select the ids of the meetings matching the ``terms`` a user searched for.
+
+    None when the terms have no word to search for.
+    """
+    query = search_query(terms)
+    if query is None:
+        return None
+    return select(meeting_search.c.rowid).where(
+        literal_column("meeting_search").op("MATCH")(query)
+    )
@@ -0,0 +1,15 @@
+"""Rebuild the summary tables and the search index of database.db.
+
+Run it from the directory holding the database with:
+
+    python -m functions.models
+"""
+
+from sqlalchemy import create_engine
+
+from . import database_location, rebuild_search_index, rebuild_stats
+
+# The functions' engine may be using an in-memory database.
+with create_engine(f"sqlite:///{database_location}").begin() as connection:
+    rebuild_stats(connection)
+    rebuild_search_index(connection)
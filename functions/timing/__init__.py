@@ -0,0 +1,163 @@
+import logging
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from json import dumps
+from time import perf_counter
+
+# Time the phases of each request, count the SQL statements, GitHub bytes and
+# push retries, and report them in a Server-Timing header and a log record.
+REQUEST_TIMING_ENABLED = os.getenv("REQUEST_TIMING_ENABLED", "false") == "true"
+
+_current_timings = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Durations and counters of the request being handled.
+
+    A phase entered again while it is running (a serializer calling another
+    one, a retried push) is only timed once, by its outermost call.
+    """
+
+    def __init__(self):
+        self.started_at = perf_counter()
+        self.durations = {}
+        self.counters = {}
+        self.running = set()
+
+    def add_duration(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0) + seconds
+
+    def add_count(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_value(self, name, value):
+        self.counters[name] = value
+
+    def total(self):
+        return perf_counter() - self.started_at
+
+    def server_timing(self, total):
+        metrics = [f"total;dur={total * 1000:.2f}"]
+        metrics.extend(
+            f"{name};dur={seconds * 1000:.2f}"
+            for name, seconds in self.durations.items()
+        )
+        metrics.extend(
+            f'{name};desc="{value}"' for name, value in self.counters.items()
+        )
+        return ", ".join(metrics)
+
+    def metrics(self, total):
+        dimensions = {"total_ms": round(total * 1000, 2)}
+        dimensions.update(
+            (f"{name}_ms", round(seconds * 1000, 2))
+            for name, seconds in self.durations.items()
+        )
+        dimensions.update(self.counters)
+        return dimensions
+
+
+def start_request():
+    """Start recording the current request, None when timing is disabled."""
+    if not REQUEST_TIMING_ENABLED:
+        return None
+    timings = RequestTimings()
+    _current_timings.set(timings)
+    return timings
+
+
+def finish_request(timings, request, response):
+    """Add the Server-Timing header to ``response`` and log the timings.
+
+    The host's Application Insights logging only keeps the message of the
+    record, so the timings are written in it as JSON, for queries to read
+    back with ``parse_json(substring(message, indexof(message, "{")))``.
+    """
+    _current_timings.set(None)
+    total = timings.total()
+    response.headers["Server-Timing"] = timings.server_timing(total)
+    metrics = {
+        "method": request.method,
+        "resources": request.route_params.get("resources"),
+        "status_code": response.status_code,
+        **timings.metrics(total),
+    }
+    logging.info("Request timings: %s", dumps(metrics))
+
+
+@contextmanager
+def phase(name):
+    """Add the time spent in the block to the ``name`` phase."""
+    timings = _current_timings.get()
+    if timings is None or name in timings.running:
+        yield
+        return
+    timings.running.add(name)
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_duration(name, perf_counter() - start)
+        timings.running.discard(name)
+
+
+def timed(name):
+    """Decorate a function so its calls are timed as the ``name`` phase."""
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _current_timings.get() is None:
+                return function(*args, **kwargs)
+            with phase(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, value=1):
+    """Add ``value`` to the ``name`` counter of the current request."""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add_count(name, value)
+
+
+def gauge(name, value):
+    """Report ``value`` as the ``name`` counter of the current request."""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.set_value(name, value)
+
+
+def add_duration(name, seconds):
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add_duration(name, seconds)
+
+
+def record_sql(engine):
+    """Count and time the statements and commits run on ``engine``.
+
+    Registered by the dashboard rather than the models, which the migrations
+    workflow imports on a checkout without this package.
+    """
+    if not REQUEST_TIMING_ENABLED:
+        return
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_statement_timer(connection, cursor, statement, *args):
+        connection.info["statement_started_at"] = perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def record_statement(connection, cursor, statement, *args):
+        count("sql_statements")
+        add_duration("sql", perf_counter() - connection.info["statement_started_at"])
+
+    @event.listens_for(engine, "commit")
+    def record_commit(connection):
+        count("sql_commits")
@@ -0,0 +1,85 @@
+"""Add summary tables
+
+Revision ID: 3f6d0b8e4c12
+Revises: 8c3e5f27a9d1
+Create Date: 2026-10-18 11:32:48.614092
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3f6d0b8e4c12"
+down_revision = "8c3e5f27a9d1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_tables adds and fills these tables on the first write after a
+    # deploy, a database written to before this migration ran already has them.
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table("label_stats"):
+        op.create_table(
+            "label_stats",
+            sa.Column("label_id", sa.Integer(), nullable=False),
+            sa.Column("meeting_count", sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(
+                ["label_id"],
+                ["label.id"],
+            ),
+            sa.PrimaryKeyConstraint("label_id"),
+        )
+        op.execute(
+            """
+            INSERT INTO label_stats (label_id, meeting_count)
+            SELECT label_id, COUNT(*) FROM meetings_labels GROUP BY label_id
+            """
+        )
+    if not inspector.has_table("participant_stats"):
+        op.create_table(
+            "participant_stats",
+            sa.Column("participant_id", sa.Integer(), nullable=False),
+            sa.Column("meeting_count", sa.Integer(), nullable=False),
+            sa.Column("total_minutes", sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(
+                ["participant_id"],
+                ["participant.id"],
+            ),
+            sa.PrimaryKeyConstraint("participant_id"),
+        )
+        op.execute(
+            """
+            INSERT INTO participant_stats (participant_id, meeting_count, total_minutes)
+            SELECT
+                meetings_participants.participant_id,
+                COUNT(*),
+                COALESCE(SUM(
+                    (strftime('%s', meeting.date_ended) - strftime('%s', meeting.date_started))
+                    / 60
+                ), 0)
+            FROM meetings_participants
+            JOIN meeting ON meeting.id = meetings_participants.meeting_id
+            GROUP BY meetings_participants.participant_id
+            """
+        )
+    if not inspector.has_table("daily_stats"):
+        op.create_table(
+            "daily_stats",
+            sa.Column("day", sa.Date(), nullable=False),
+            sa.Column("meeting_count", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("day"),
+        )
+        op.execute(
+            """
+            INSERT INTO daily_stats (day, meeting_count)
+            SELECT date(date_started), COUNT(*) FROM meeting GROUP BY date(date_started)
+            """
+        )
+
+
+def downgrade():
+    op.drop_table("daily_stats")
+    op.drop_table("participant_stats")
+    op.drop_table("label_stats")
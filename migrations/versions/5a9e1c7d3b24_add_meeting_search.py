@@ -0,0 +1,57 @@
+"""Add meeting search
+
+Revision ID: 5a9e1c7d3b24
+Revises: 3f6d0b8e4c12
+Create Date: 2026-10-18 15:07:21.482317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5a9e1c7d3b24"
+down_revision = "3f6d0b8e4c12"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_tables adds and fills the index on the first write after a
+    # deploy, a database written to before this migration ran already has it.
+    if sa.inspect(op.get_bind()).has_table("meeting_search"):
+        return
+    op.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS meeting_search USING fts5(
+            name, participants, labels, prefix='2 3',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO meeting_search (rowid, name, participants, labels)
+        SELECT
+            meeting.id,
+            meeting.name,
+            COALESCE((
+                SELECT group_concat(participant.name, ' ')
+                FROM meetings_participants
+                JOIN participant
+                ON participant.id = meetings_participants.participant_id
+                WHERE meetings_participants.meeting_id = meeting.id
+            ), ''),
+            COALESCE((
+                SELECT group_concat(label.name, ' ')
+                FROM meetings_labels
+                JOIN label ON label.id = meetings_labels.label_id
+                WHERE meetings_labels.meeting_id = meeting.id
+            ), '')
+        FROM meeting
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TABLE meeting_search")
@@ -0,0 +1,93 @@
+"""Add query indexes
+
+Revision ID: 8c3e5f27a9d1
+Revises: 14e41da7f7a4
+Create Date: 2026-10-18 10:42:13.208417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8c3e5f27a9d1"
+down_revision = "14e41da7f7a4"
+branch_labels = None
+depends_on = None
+
+
+def merge_names_differing_in_case(table, association_table, foreign_key):
+    """Merge rows whose names only differ in ASCII case into the oldest one.
+
+    The dashboard matches names case-insensitively, these duplicates would
+    break the unique NOCASE index.
+    """
+    duplicates = f"""
+        SELECT duplicate.id AS duplicate_id, MIN(kept.id) AS kept_id
+        FROM {table} AS duplicate
+        JOIN {table} AS kept
+        ON kept.name = duplicate.name COLLATE NOCASE AND kept.id < duplicate.id
+        GROUP BY duplicate.id
+    """
+    op.execute(
+        f"""
+        INSERT OR IGNORE INTO {association_table} (meeting_id, {foreign_key})
+        SELECT association.meeting_id, duplicates.kept_id
+        FROM {association_table} AS association
+        JOIN ({duplicates}) AS duplicates
+        ON association.{foreign_key} = duplicates.duplicate_id
+        """
+    )
+    op.execute(
+        f"""
+        DELETE FROM {association_table}
+        WHERE {foreign_key} IN (SELECT duplicate_id FROM ({duplicates}))
+        """
+    )
+    op.execute(
+        f"DELETE FROM {table} WHERE id IN (SELECT duplicate_id FROM ({duplicates}))"
+    )
+
+
+def upgrade():
+    op.create_index(
+        "ix_meeting_active",
+        "meeting",
+        ["date_started", "id"],
+        sqlite_where=sa.text("date_ended IS NULL"),
+    )
+    op.create_index("ix_meeting_date_started", "meeting", ["date_started", "id"])
+    op.create_index(
+        "ix_meetings_participants_participant_id",
+        "meetings_participants",
+        ["participant_id", "meeting_id"],
+    )
+    op.create_index(
+        "ix_meetings_labels_label_id", "meetings_labels", ["label_id", "meeting_id"]
+    )
+
+    merge_names_differing_in_case(
+        "participant", "meetings_participants", "participant_id"
+    )
+    merge_names_differing_in_case("label", "meetings_labels", "label_id")
+    op.create_index(
+        "ix_participant_name_nocase",
+        "participant",
+        [sa.text("name COLLATE NOCASE")],
+        unique=True,
+    )
+    op.create_index(
+        "ix_label_name_nocase", "label", [sa.text("name COLLATE NOCASE")], unique=True
+    )
+
+
+def downgrade():
+    # Merged duplicate names are not split back.
+    op.drop_index("ix_label_name_nocase", table_name="label")
+    op.drop_index("ix_participant_name_nocase", table_name="participant")
+    op.drop_index("ix_meetings_labels_label_id", table_name="meetings_labels")
+    op.drop_index(
+        "ix_meetings_participants_participant_id", table_name="meetings_participants"
+    )
+    op.drop_index("ix_meeting_date_started", table_name="meeting")
+    op.drop_index("ix_meeting_active", table_name="meeting")
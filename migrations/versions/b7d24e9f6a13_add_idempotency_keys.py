@@ -0,0 +1,44 @@
+"""Add idempotency keys
+
+Revision ID: b7d24e9f6a13
+Revises: 5a9e1c7d3b24
+Create Date: 2026-10-18 16:41:09.730215
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "b7d24e9f6a13"
+down_revision = "5a9e1c7d3b24"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_tables adds the table on the first write after a deploy, a
+    # database written to before this migration ran already has it.
+    if sa.inspect(op.get_bind()).has_table("idempotency_key"):
+        return
+    op.create_table(
+        "idempotency_key",
+        sa.Column("key", sa.String(length=255), nullable=False),
+        sa.Column("fingerprint", sa.String(length=64), nullable=False),
+        sa.Column("status_code", sa.Integer(), nullable=False),
+        sa.Column("mimetype", sa.String(length=100), nullable=False),
+        sa.Column("body", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("key"),
+    )
+    op.create_index(
+        op.f("ix_idempotency_key_created_at"),
+        "idempotency_key",
+        ["created_at"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(op.f("ix_idempotency_key_created_at"), table_name="idempotency_key")
+    op.drop_table("idempotency_key")
@@ -0,0 +1,95 @@
+"""Add archived stats and never reuse meeting ids
+
+Revision ID: c3f9a6e2d418
+Revises: b7d24e9f6a13
+Create Date: 2026-10-18 18:12:44.905318
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "c3f9a6e2d418"
+down_revision = "b7d24e9f6a13"
+branch_labels = None
+depends_on = None
+
+
+def rebuild_meeting_table(autoincrement):
+    # SQLite can't add AUTOINCREMENT to a table, it is copied into a new one.
+    # Explicit ids bring sqlite_sequence up to the highest one.
+    op.execute(
+        f"""
+        CREATE TABLE meeting_new (
+            id INTEGER NOT NULL
+                PRIMARY KEY{" AUTOINCREMENT" if autoincrement else ""},
+            name VARCHAR(100),
+            date_started DATETIME NOT NULL,
+            date_ended DATETIME,
+            link VARCHAR(500) DEFAULT '',
+            UNIQUE (name)
+        )
+        """
+    )
+    op.execute(
+        "INSERT INTO meeting_new (id, name, date_started, date_ended, link)"
+        " SELECT id, name, date_started, date_ended, link FROM meeting"
+    )
+    op.execute("DROP TABLE meeting")
+    op.execute("ALTER TABLE meeting_new RENAME TO meeting")
+    op.execute(
+        "CREATE INDEX ix_meeting_active ON meeting (date_started, id)"
+        " WHERE date_ended IS NULL"
+    )
+    op.execute("CREATE INDEX ix_meeting_date_started ON meeting (date_started, id)")
+
+
+def meeting_table_has_autoincrement():
+    table_sql = (
+        op.get_bind()
+        .exec_driver_sql("SELECT sql FROM sqlite_master WHERE name = 'meeting'")
+        .scalar_one()
+    )
+    return "AUTOINCREMENT" in table_sql.upper()
+
+
+def upgrade():
+    # A database created by create_tables already has AUTOINCREMENT, and
+    # create_tables adds the archived_* tables on the first write after a
+    # deploy, a database written to before this migration ran has them too.
+    if not meeting_table_has_autoincrement():
+        rebuild_meeting_table(autoincrement=True)
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table("archived_label_stats"):
+        op.create_table(
+            "archived_label_stats",
+            sa.Column("label_id", sa.Integer(), nullable=False),
+            sa.Column("meeting_count", sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(["label_id"], ["label.id"]),
+            sa.PrimaryKeyConstraint("label_id"),
+        )
+    if not inspector.has_table("archived_participant_stats"):
+        op.create_table(
+            "archived_participant_stats",
+            sa.Column("participant_id", sa.Integer(), nullable=False),
+            sa.Column("meeting_count", sa.Integer(), nullable=False),
+            sa.Column("total_minutes", sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(["participant_id"], ["participant.id"]),
+            sa.PrimaryKeyConstraint("participant_id"),
+        )
+    if not inspector.has_table("archived_daily_stats"):
+        op.create_table(
+            "archived_daily_stats",
+            sa.Column("day", sa.Date(), nullable=False),
+            sa.Column("meeting_count", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("day"),
+        )
+
+
+def downgrade():
+    op.drop_table("archived_daily_stats")
+    op.drop_table("archived_participant_stats")
+    op.drop_table("archived_label_stats")
+    if meeting_table_has_autoincrement():
+        rebuild_meeting_table(autoincrement=False)